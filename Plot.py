@@ -1,75 +1,73 @@
 import pandas as pd
 from matplotlib import pyplot as plt
 from matplotlib.patches import Polygon
-import matplotlib
 from matplotlib.ticker import MultipleLocator
 import numpy as np
 import os
+import sys
+import getopt
 
 from utils import askDir, \
                   _choice
-
-
-def extractData(DF):
-    reqDF = DF[['Temperature', 'Phase', 'Mass', 'F']]
-    reqDF = reqDF.set_index('Temperature')
-
-    # Y Data
-    yData = reqDF.index.drop_duplicates()
-
-    # For X Data, which is basically the melt fraction
-    xData = []
-    for temp in yData:
-        F = reqDF.loc[temp, 'F']
-        if isinstance(F, np.float64):
-            xData.append(F)
+from downsample import decimateLine, \
+                       decimatePolygon
+from tidyTables import readCSV, \
+                       tablePath
+from derivedData import assemblageSegments
+
+
+def readStepPath(mainpath):
+    """Reads the Temperature and F of every step from system_main.csv, None if
+    the run has no system_main
+    """
+    path = tablePath(mainpath, 'system_main')
+    if not path:
+        return None
+
+    return pd.read_csv(path, usecols=['Temperature', 'F'])
+
+
+def phasePolygons(segments, path=None):
+    """Returns the polygon of every assemblage segment, bounded by the melt
+    fraction (F) on one side and F = 0 on the other
+
+    Arguments:
+        segments {DataFrame} -- assemblages table (see assemblageSegments)
+
+    Keyword Arguments:
+        path {DataFrame} -- Temperature and F of every step, if None only the
+            boundaries of the segments are used (default: {None})
+    """
+    steps = None
+    if path is not None and len(segments):
+        F = path['F'].to_numpy(dtype=float)
+        T = path['Temperature'].to_numpy(dtype=float)
+
+        # The steps of the path have to be the steps of the segments, which is
+        # not the case if system_main has rows phase_main does not
+        starts = segments['StepStart'].to_numpy()
+        ends = segments['StepEnd'].to_numpy()
+        if len(T) > ends.max() \
+                and np.allclose(T[starts], segments['TStart'].to_numpy(dtype=float)) \
+                and np.allclose(T[ends], segments['TEnd'].to_numpy(dtype=float)):
+            steps = list(zip(F, T))
         else:
-            xData.append(F.values[0])
-    
-    phases = []
-    deltaT = []    
+            print("[-] The steps of system_main do not match the assemblages, "
+                  "only the boundaries of the assemblages are drawn")
 
-    for temp in reqDF.index:
-        avlP = reqDF.loc[temp, 'Phase']
-        if isinstance(avlP, str):
-            avlP = set([avlP])
+    polygons = []
+    for segment in segments.itertuples():
+        if steps is not None:
+            boundary = steps[segment.StepStart:segment.StepEnd + 1]
         else:
-            avlP = set(avlP.values)
-            
-        if len(phases) == 0:
-            phases.append(avlP)
-        elif avlP != phases[-1]:
-            phases.append(avlP)
-            deltaT.append(temp)    
+            boundary = [(segment.FStart, segment.TStart), (segment.FEnd, segment.TEnd)]
 
-    # Appending last temperature Value
-    deltaT.append(reqDF.index[-1])
+        polygons.append(
+            [(0, segment.TStart)] + boundary + [(0, segment.TEnd)]
+        )
 
-    polygons = []
-    currentPolygon = [
-        (0, yData[0]), 
-        (xData[0], yData[0])
-    ]
-
-    for temperature, F in zip(yData, xData):
-        if temperature in deltaT:
-            currentPolygon.extend([
-                (F, temperature),
-                (0, temperature)
-            ])
-            
-            polygons.append(currentPolygon)
-            # print("Created Polygon: ", temperature)
-            currentPolygon = [
-                (0, temperature),
-                (F, temperature)
-            ]
-        else:
-            # print("Here: ", temperature)
-            currentPolygon.append((F, temperature))
+    return polygons
 
-    return xData, yData, phases, deltaT, polygons
-    
 
 def mapPhases(phases):
     shorthands = {
@@ -96,38 +94,54 @@ def mapPhases(phases):
     return tuple(beautifulPhases)
 
 
-def phasePlot(mainpath, outputpath=None, title=None):
-    filename = "phase_main.csv"
-    DF = pd.read_csv(os.path.join(mainpath, filename))
+def makePhasePlot(DF, title, budget=None, path=None):
+    """Creates the figure of the coexisting phases, without showing or saving
+    it, and returns the figure and its axes
 
-    xData, yData, phases, deltaPhase, polygons = extractData(DF)
+    Arguments:
+        DF {DataFrame} -- assemblages table, or phase_main table from which
+            the assemblages are computed
+        title {str} -- Title of the graph
 
-    if not title:
-        title = input("\nEnter Title for Graph: ")
+    Keyword Arguments:
+        budget {int} -- Maximum number of vertices of every phase polygon
+            (default: {None})
+        path {DataFrame} -- Temperature and F of every step (see
+            readStepPath), taken from phase_main if DF is phase_main
+            (default: {None})
+    """
+    if 'Phases' not in DF.columns:
+        path = DF.drop_duplicates('Temperature')[['Temperature', 'F']]
+        DF = assemblageSegments(DF)
 
-    phases = mapPhases(phases)
+    if len(DF) == 0:
+        raise ValueError("No phase data to plot")
+
+    polygons = phasePolygons(DF, path)
+    phases = mapPhases([segment.split(" + ") for segment in DF['Phases']])
+    temperatures = DF[['TStart', 'TEnd']].to_numpy(dtype=float)
 
     fig, ax = plt.subplots(figsize=(6, 8))
 
-    plt.axis([0, 1.1, min(yData), max(yData)])
-    plt.xlabel('Melt fraction (F)')
-    plt.ylabel('Temperature')
+    ax.axis([0, 1.1, temperatures.min(), temperatures.max()])
+    ax.set_xlabel('Melt fraction (F)')
+    ax.set_ylabel('Temperature')
 
     minorLocator = MultipleLocator(5)
     majorLocator = MultipleLocator(20)
     ax.yaxis.set_minor_locator(minorLocator)
 
-    plt.grid(alpha=0.5, linestyle='--')
-    plt.title(title)
+    ax.grid(alpha=0.5, linestyle='--')
+    ax.set_title(title)
 
     # Colors
-    cmap = matplotlib.cm.get_cmap('Wistia')
+    cmap = plt.get_cmap('Wistia')
     colors = np.linspace(0, 1, len(phases))
     colors = [cmap(color) for color in colors]
 
     for polygon, phase, color in zip(polygons, phases, colors):
         pltPoly = Polygon(
-            polygon,
+            decimatePolygon(polygon, budget),
             facecolor=color,
             edgecolor='0.1',
             label=" + ".join(phase)
@@ -135,6 +149,25 @@ def phasePlot(mainpath, outputpath=None, title=None):
         ax.add_patch(pltPoly)
 
     lgd = ax.legend(loc="upper left", bbox_to_anchor=(1, 1))
+
+    return fig, ax
+
+
+def phasePlot(mainpath, outputpath=None, title=None, budget=None):
+    # The assemblages written by beautifyData are used when present, which
+    # saves reading the whole of phase_main
+    segmentsPath = os.path.join(mainpath, "assemblages.csv")
+    if os.path.isfile(segmentsPath):
+        DF = pd.read_csv(segmentsPath)
+        path = readStepPath(mainpath)
+    else:
+        DF = pd.read_csv(os.path.join(mainpath, "phase_main.csv"))
+        path = None
+
+    if not title:
+        title = input("\nEnter Title for Graph: ")
+
+    fig, ax = makePhasePlot(DF, title, budget, path)
     
     choice = input("\nDo you want to see the plot? (Y/N): ")
 
@@ -171,7 +204,7 @@ def askAxes(DF):
     return column
 
 
-def _plotfractionationScheme(DF, xCol, yCol, fig=None, ax=None):
+def _plotfractionationScheme(DF, xCol, yCol, fig=None, ax=None, budget=None):
     if not fig or not ax:
         fig, ax = plt.subplots()
         ax.set_xlabel(xCol)
@@ -190,13 +223,13 @@ def _plotfractionationScheme(DF, xCol, yCol, fig=None, ax=None):
     
     xData, yData = DF[xCol], DF[yCol]
 
-    ax.plot(xData.values, yData.values)
+    ax.plot(*decimateLine(xData.values, yData.values, budget))
     ax.scatter(xData[0], yData[0], marker='+', linewidth=20)
 
     return fig, ax
 
 
-def fractionationScheme(mainpath, outputpath):
+def fractionationScheme(mainpath, outputpath, budget=None):
     choice = True
 
     fig, ax = (None, None)
@@ -210,7 +243,7 @@ def fractionationScheme(mainpath, outputpath):
         xCol = askAxes(DF)
         yCol = askAxes(DF)
 
-        fig, ax = _plotfractionationScheme(DF, xCol, yCol, fig, ax)
+        fig, ax = _plotfractionationScheme(DF, xCol, yCol, fig, ax, budget)
 
         choice = _choice("Do you want to add more Data? (New Data should be of same columns)")
     
@@ -250,19 +283,38 @@ def readDf(path=None):
         print("\nChoose the File containing Data")
         path = askFile("Choose DataFrame")
 
-    DF = pd.read_csv(path)
+    DF = readCSV(path)
     return DF
 
 
+def getBudget():
+    """Reads the point budget for the plots from the arguments (-b <points>),
+    None if the plots are not to be decimated
+    """
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "b:", ["budget="])
+    except getopt.GetoptError:
+        print('{} -b <points>'.format(sys.argv[0]))
+        sys.exit(2)
+
+    budget = None
+    for opt, arg in opts:
+        if opt in ("-b", "--budget"):
+            budget = int(arg)
+
+    return budget
+
+
 if __name__ == '__main__':
+    budget = getBudget()
     mainpath, outputpath = askDir()
 
     choice = welcomeScreen()
 
     while choice != '0':
         if choice == '1':
-            phasePlot(mainpath, outputpath)
+            phasePlot(mainpath, outputpath, budget=budget)
         elif choice == '2':
-            fractionationScheme(mainpath, outputpath)
+            fractionationScheme(mainpath, outputpath, budget)
 
         choice = welcomeScreen()
\ No newline at end of file
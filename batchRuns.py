@@ -0,0 +1,313 @@
+import hashlib
+import getopt
+import json
+import sys
+import os
+
+# From local file
+from utils import readTable, \
+                  writeCSV
+from runSource import iterRuns
+from beautifyData import extractData
+
+
+MANIFEST = 'manifest.jsonl'
+
+# Manifest written as a single JSON file, read if there is no log yet
+LEGACYMANIFEST = 'manifest.json'
+
+
+def hashRun(inputfiles, options=None):
+    """Returns the content hash of a run, two runs with identical tables (and
+    extraction options) have the same hash, irrespective of their names or
+    whether their tables are compressed
+
+    Arguments:
+        inputfiles {dict} -- name of the table: lines of the table
+
+    Keyword Arguments:
+        options {dict} -- options of the extraction (default: {None})
+    """
+    sha = hashlib.sha256()
+    sha.update(json.dumps(options or {}, sort_keys=True).encode())
+
+    for key in sorted(inputfiles.keys()):
+        sha.update(key.encode() + b'\0')
+        for line in inputfiles[key]:
+            sha.update(line.encode())
+        sha.update(b'\0')
+
+    return sha.hexdigest()
+
+
+class Manifest:
+    """Records the content hash, status and output of every run of a batch,
+    in a JSON lines log in the output directory. Every change of status is
+    appended to the log as it happens, hence a batch can be resumed after a
+    crash, and the log is rewritten with the last record of every run once
+    the batch is done (see compact).
+
+    Arguments:
+        outputDir {str} -- Output directory of the batch
+    """
+
+    def __init__(self, outputDir):
+        self.path = os.path.join(outputDir, MANIFEST)
+        self.runs = dict()
+
+        # Hash: name of the run whose output has the tables of the hash
+        self._done = dict()
+
+        legacy = os.path.join(outputDir, LEGACYMANIFEST)
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A record cut short by a crash
+                        continue
+                    self._set(record.pop('name'), record)
+        elif os.path.isfile(legacy):
+            with open(legacy) as f:
+                for name, entry in json.load(f)['runs'].items():
+                    self._set(name, entry)
+
+    def _set(self, name, entry):
+        previous = self.runs.get(name)
+        if previous and self._done.get(previous['hash']) == name:
+            del self._done[previous['hash']]
+
+        self.runs[name] = entry
+        if entry['status'] == 'done':
+            self._done.setdefault(entry['hash'], name)
+
+    def isDone(self, name, runHash):
+        entry = self.runs.get(name)
+        if not entry or entry['hash'] != runHash:
+            return False
+
+        if entry['status'] == 'reused':
+            # The output belongs to the source run, which may have been
+            # processed again since, with other tables
+            source = self.runs.get(entry.get('source'))
+            return bool(source) \
+                and source['status'] == 'done' \
+                and source['hash'] == runHash \
+                and source['output'] == entry['output'] \
+                and os.path.isdir(entry['output'])
+
+        return entry['status'] == 'done' and os.path.isdir(entry['output'])
+
+    def outputFor(self, runHash):
+        """Returns the name and the output of an already processed run with
+        the same hash, None if there is no such run
+        """
+        name = self._done.get(runHash)
+        if name is None or not os.path.isdir(self.runs[name]['output']):
+            return None
+
+        return name, self.runs[name]['output']
+
+    def update(self, name, **entry):
+        self._set(name, entry)
+        self._append(dict(entry, name=name))
+
+    def _append(self, record):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    def compact(self):
+        """Rewrites the log with only the last record of every run"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Written to a temporary file first, so that a crash while writing
+        # never leaves a broken manifest behind
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for name, entry in self.runs.items():
+                f.write(json.dumps(dict(entry, name=name), sort_keys=True) + '\n')
+        os.replace(tmp, self.path)
+
+
+def processBatch(source, outputDir, convertTemp=False, separatePhases=False,
+                 parseFormulas=False, sparse=False, workers=1):
+    """Extracts every run of a batch and writes its CSV files, skipping the
+    runs which are already done and reusing the outputs of identical runs
+
+    Arguments:
+        source {str} -- Directory of runs, or an archive (see iterRuns)
+        outputDir {str} -- Directory where the CSV files of the runs and the
+            manifest are written
+
+    Keyword Arguments:
+        convertTemp {bool} -- Convert Temperatures from K to C
+            (default: {False})
+        separatePhases {bool} -- Write a separate CSV for every Phase
+            (default: {False})
+        parseFormulas {bool} -- Write the stoichiometry of the solids
+            (default: {False})
+        sparse {bool} -- Write phase_mass, phase_vol and solid_comp in long
+            form, without their zeros (default: {False})
+        workers {int} -- Number of processes extracting the tables of a run
+            (see extractData) (default: {1})
+
+    Returns:
+        Manifest -- the manifest of the batch
+    """
+    manifest = Manifest(outputDir)
+    options = {'convertTemp': convertTemp, 'separatePhases': separatePhases}
+    if parseFormulas:
+        options['parseFormulas'] = True
+    if sparse:
+        options['sparse'] = True
+
+    for name, inputfiles in iterRuns(source):
+        inputfiles = {key: readTable(table) for key, table in inputfiles.items()}
+        runHash = hashRun(inputfiles, options)
+
+        if manifest.isDone(name, runHash):
+            print("[+] Skipping {}, already processed".format(name))
+            continue
+
+        existing = manifest.outputFor(runHash)
+        if existing:
+            source, output = existing
+            print("[+] Reusing {} for {}, the tables are identical".format(output, name))
+            manifest.update(
+                name,
+                hash=runHash,
+                status='reused',
+                output=output,
+                source=source
+            )
+            continue
+
+        runOutput = os.path.abspath(os.path.join(outputDir, name))
+        manifest.update(name, hash=runHash, status='running', output=runOutput)
+
+        try:
+            Data = extractData(
+                inputfiles,
+                convertTemp,
+                separatePhases,
+                parseFormulas=parseFormulas,
+                workers=workers
+            )
+            writeCSV(Data, runOutput, sparse)
+        except Exception as e:
+            print("[-] Failed to process {}: {}".format(name, e))
+            manifest.update(
+                name,
+                hash=runHash,
+                status='failed',
+                output=runOutput,
+                error=repr(e)
+            )
+            continue
+
+        manifest.update(name, hash=runHash, status='done', output=runOutput)
+
+    manifest.compact()
+    return manifest
+
+
+def collectBatch(source, store, tables=None, convertTemp=False):
+    """Extracts every run of a batch into a TableStore, which keeps the
+    tables within its memory budget, for aggregating the runs in one process
+
+    Arguments:
+        source {str} -- Directory of runs, or an archive (see iterRuns)
+        store {TableStore} -- Store for the tables of the runs
+
+    Keyword Arguments:
+        tables {tuple} -- Tables to be kept, all if None (default: {None})
+        convertTemp {bool} -- Convert Temperatures from K to C
+            (default: {False})
+
+    Returns:
+        TableStore -- the store
+    """
+    for name, inputfiles in iterRuns(source):
+        Data = extractData(inputfiles, convertTemp, separatePhases=False)
+
+        if tables is not None:
+            Data = {key: Data[key] for key in tables}
+
+        store.putRun(name, Data)
+        print("[+] {} runs collected, {:.1f} MB in memory, {} tables spilled to disk".format(
+            len(store.runs()),
+            store.memory / 2**20,
+            store.spilled
+        ))
+
+    return store
+
+
+def getArgs():
+    """Reads the source, the output directory and the options from the
+    arguments
+    """
+    usage = '{} -i <runs directory or archive> -o <output directory> [-c] [-s] [-f] [-l] [-w <workers>]'.format(sys.argv[0])
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            "i:o:csflw:",
+            ["input=", "output=", "celsius", "separate", "formulas", "long", "workers="]
+        )
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+
+    source, outputDir = None, None
+    convertTemp, separatePhases, parseFormulas, sparse = False, False, False, False
+    workers = 1
+    for opt, arg in opts:
+        if opt in ("-i", "--input"):
+            source = arg
+        elif opt in ("-o", "--output"):
+            outputDir = arg
+        elif opt in ("-c", "--celsius"):
+            convertTemp = True
+        elif opt in ("-s", "--separate"):
+            separatePhases = True
+        elif opt in ("-f", "--formulas"):
+            parseFormulas = True
+        elif opt in ("-l", "--long"):
+            sparse = True
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
+
+    if not source or not outputDir:
+        print(usage)
+        sys.exit(2)
+
+    return source, outputDir, convertTemp, separatePhases, parseFormulas, sparse, workers
+
+
+if __name__ == '__main__':
+    source, outputDir, convertTemp, separatePhases, parseFormulas, sparse, workers = getArgs()
+
+    manifest = processBatch(
+        source,
+        outputDir,
+        convertTemp,
+        separatePhases,
+        parseFormulas,
+        sparse,
+        workers
+    )
+
+    statuses = [entry['status'] for entry in manifest.runs.values()]
+    print("[+] {} runs: {} done, {} reused, {} failed".format(
+        len(statuses),
+        statuses.count('done'),
+        statuses.count('reused'),
+        statuses.count('failed')
+    ))
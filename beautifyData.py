@@ -1,5 +1,8 @@
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import numpy as np
+import io
 import sys 
 import os
 from datetime import datetime as dt
@@ -10,7 +13,12 @@ from utils import getArgs, \
                   writeCSV, \
                   moveTables, \
                   figureoutTable, \
+                  readTable, \
                   _separatePhaseFiles 
+from runSource import iterRuns, \
+                      isArchive
+from formulas import formulaTable
+from derivedData import assemblageSegments
 
 
 def returnCols(tbl, line1, line2):
@@ -70,35 +78,44 @@ def returnCols(tbl, line1, line2):
     return columns
 
 
-def _extractPhaseMainT1(phase, f):
-    """For any particular phase data, which will be passed as a deque object,
-    this function will extract all the necessary columns and return a DataFrame
-    object.
+def _extractPhaseMainT1(block, f):
+    """Extracts the data of a single phase of a type 1 phase_main table. The
+    rows of the block are parsed at once into (numeric) columns, and the
+    Phase and F columns are then attached as whole columns.
     
     Arguments:
-        phase {deque object} -- for one phase, whole table from output, as a 
-            deque object
+        block {list} -- lines of the block of one phase, the two header lines
+            followed by one line per temperature
         f {list} -- list of the Melt Fraction remaining data for each 
-            temperature
+            temperature, only as many rows are read
     """
 
-    phaseName = phase[0].split(" ")[0]
-    
-    line1 = phase.popleft()
-    line2 = phase.popleft()
-    
-    columns = returnCols(1, line1, line2)
-    
-    rawData = []
-    
-    for line, F in zip(phase, f):
-        PTcond = [x.strip() for x in line.split(" ")]
-        PTcond.insert(2, phaseName)
-        PTcond.insert(9, None)
-        rawData.append(PTcond)
-    
-    DF = pd.DataFrame(data=rawData, columns=columns)
-    
+    phaseName = block[0].split(" ")[0]
+
+    columns = returnCols(1, block[0], block[1])
+
+    # Phase (columns[2]) and F (columns[9]) are not present in the rows
+    rowColumns = columns[:2] + columns[3:9] + columns[10:]
+
+    rows = block[2:2 + len(f)]
+
+    if rows:
+        DF = pd.read_csv(
+            io.StringIO(''.join(rows).replace('\r', '')),
+            sep=' ',
+            header=None
+        )
+        if DF.shape[1] != len(rowColumns):
+            raise ValueError("{} columns passed, passed data had {} columns".format(
+                len(rowColumns), DF.shape[1]
+            ))
+        DF.columns = rowColumns
+    else:
+        DF = pd.DataFrame(columns=rowColumns)
+
+    DF.insert(2, 'Phase', phaseName)
+    DF.insert(9, 'F', np.nan)
+
     return DF
 
 
@@ -203,77 +220,73 @@ def extractPhaseMain(phase_main, F):
         F {list} -- List of F (remaining melt fraction) values for all the 
             temperatures
     """
-    tbl = figureoutTable(phase_main)
+    lines = readTable(phase_main)
+    tbl = figureoutTable(lines)
 
-    with open(phase_main, 'r') as f:
-        output = deque(f.readlines())
-        title = output.popleft()
-        _ = output.popleft()
-        
-        if tbl == 1:
-            # List for storing all the DataFrames
-            phaseDFs = []
-            phase = deque()
-            
-            while len(output) > 0:
-                currentLine = output.popleft()
-                if currentLine.strip() != '':
-                    phase.append(currentLine)
-                else:
-                    phaseDFs.append(_extractPhaseMainT1(phase, F))
-                    phase = deque()
-        
-            DF = pd.concat(phaseDFs, join='outer', sort=False)
-            DF = DF.sort_values('Temperature', ascending=False)
-            DF = DF.reset_index()
-            DF = DF.drop(columns=['index'], errors='ignore')
-
-            temp = 0
-            previousTemp = None
-
-            for i, currentTemp in enumerate(DF['Temperature'].values):
-                if currentTemp == previousTemp:
-                    DF.loc[i, 'F'] = DF.loc[i-1, 'F']
-                else:
-                    DF.loc[i, 'F'] = F[temp]
-                    temp += 1
-                    previousTemp = currentTemp
-
-        elif tbl == 2:
-            iteration = []
-            
-            columns = returnCols(tbl, output[0], None)
-            
-            DF = pd.DataFrame(columns=columns)
+    output = deque(lines)
+    title = output.popleft()
+    _ = output.popleft()
 
-            # Getting the values for Melt Remaining (f)
-            fvals = F
+    if tbl == 1:
+        # Blocks of the phases are separated by blank lines, hence the
+        # boundaries of all the blocks are found at once
+        body = lines[2:]
+        blanks = [i for i, line in enumerate(body) if line.strip() == '']
 
-            # With every append, this goes up by one, hence can be effectively used 
-            # for accessing the correct f value fro the given PT condition
-            faccessor = 0
+        # List for storing all the DataFrames
+        phaseDFs = []
+        start = 0
 
-            while(len(output) > 0):
-                
-                line = output.popleft().strip("\n")
+        for end in blanks:
+            if end > start:
+                phaseDFs.append(_extractPhaseMainT1(body[start:end], F))
+            start = end + 1
 
-                if line.split(" ")[0] != "Pressure":
-                    iteration.append(line)
-                elif line.split(" ")[0] == "Pressure":
-                    if len(iteration) != 0:
-                        # Read the data and fill No data Values with None
-                        currentEnv = _extractPhaseDataT2(
-                            iteration,
-                            fvals[faccessor],
-                            columns
-                        )
-                        # Convert this to pandas DataFrame
-                        DF = DF.append(currentEnv)
-                    # Next iteration
-                    iteration = [line]
-                    faccessor += 1
+        # The last block is not followed by a blank line if the file does not
+        # end with one
+        if start < len(body):
+            phaseDFs.append(_extractPhaseMainT1(body[start:], F))
 
-        return DF
+        DF = pd.concat(phaseDFs, join='outer', sort=False, ignore_index=True)
+        DF = DF.sort_values('Temperature', ascending=False, kind='stable')
+        DF = DF.reset_index(drop=True)
+
+        # Rows of the same Temperature are contiguous after sorting, and every
+        # Temperature is the next value of F
+        temperatures = DF['Temperature'].values
+        newTemp = np.ones(len(DF), dtype=bool)
+        newTemp[1:] = temperatures[1:] != temperatures[:-1]
+
+        DF['F'] = np.asarray(F)[np.cumsum(newTemp) - 1]
+
+    elif tbl == 2:
+        columns = returnCols(tbl, output[0], None)
+
+        # Every PT condition starts with a "Pressure P Temperature T ..." line
+        # followed by a line for every coexisting phase
+        iterations = []
+        for line in output:
+            line = line.strip("\n")
+            if line.strip() == '':
+                continue
+
+            if line.split(" ")[0] == "Pressure":
+                iterations.append([line])
+            elif iterations:
+                iterations[-1].append(line)
+
+        # The i-th PT condition has the i-th value of F (Melt Remaining)
+        steps = [
+            _extractPhaseDataT2(iteration, F[i], columns)
+            for i, iteration in enumerate(iterations)
+        ]
+
+        if steps:
+            DF = pd.concat(steps, ignore_index=True)
+        else:
+            DF = pd.DataFrame(columns=columns)
+
+    return DF
 
 
 def extractSolidComp(path):
@@ -284,31 +297,31 @@ def extractSolidComp(path):
         path {str} -- Path to the table file
     """
 
-    tbl = figureoutTable(path)
+    lines = readTable(path)
+    tbl = figureoutTable(lines)
 
     values = []
     
-    with open(path, 'r') as f:
-        output = deque(f.readlines())
+    output = deque(lines)
 
-        title = output.popleft()
-        _ = output.popleft()
+    title = output.popleft()
+    _ = output.popleft()
 
-        columns = returnCols(
-            tbl,
-            output.popleft(),
-            output.popleft()
-        )
+    columns = returnCols(
+        tbl,
+        output.popleft(),
+        output.popleft()
+    )
 
-        for line in output:
-            value = [x.strip() for x in line.split(' ')]
-            if value[-1] == '---':
-                _ = value.pop()
-                zerosToAdd = len(columns) - len(value)
+    for line in output:
+        value = [x.strip() for x in line.split(' ')]
+        if value[-1] == '---':
+            _ = value.pop()
+            zerosToAdd = len(columns) - len(value)
 
-                value.extend([0.00]*zerosToAdd)
+            value.extend([0.00]*zerosToAdd)
 
-            values.append(value)
+        values.append(value)
 
     DF = pd.DataFrame(data=values, columns=columns)
     return DF
@@ -322,24 +335,24 @@ def extractGeneric(path):
         path {str} -- Path to the table file
     """
 
-    tbl = figureoutTable(path)
+    lines = readTable(path)
+    tbl = figureoutTable(lines)
 
     values = []
     
-    with open(path, 'r') as f:
-        output = deque(f.readlines())
+    output = deque(lines)
 
-        title = output.popleft()
-        _ = output.popleft()
+    title = output.popleft()
+    _ = output.popleft()
 
-        columns = returnCols(
-            tbl,
-            output.popleft(),
-            output.popleft()
-        )
+    columns = returnCols(
+        tbl,
+        output.popleft(),
+        output.popleft()
+    )
 
-        for line in output:
-            values.append([value.strip() for value in line.split(' ') if value.strip()])
+    for line in output:
+        values.append([value.strip() for value in line.split(' ') if value.strip()])
 
     DF = pd.DataFrame(data=values, columns=columns)
     return DF
@@ -355,30 +368,95 @@ def extractSystemMain(path):
 
     values = []
     
-    tbl = figureoutTable(path)
+    lines = readTable(path)
+    tbl = figureoutTable(lines)
 
-    with open(path) as f:
-        output = deque(f.readlines())
-        
-        Title = output.popleft()
-        _ = output.popleft()
+    output = deque(lines)
 
-        columns = returnCols(tbl, output.popleft(), output.popleft())
+    Title = output.popleft()
+    _ = output.popleft()
+
+    columns = returnCols(tbl, output.popleft(), output.popleft())
+
+    for line in output:
+        values.append([value.strip() for value in line.split()])
 
-        for line in output:
-            values.append([value.strip() for value in line.split()])
-    
     DF = pd.DataFrame(data=values, columns=columns)
     DF['F'] = pd.to_numeric(DF['F']).cumprod()
     return DF
 
 
-def extractData(inputfiles):
+def _extract(name, func, *args):
+    """Calls the extraction function of a table, printing its progress"""
+    print("[+] Extracting {}".format(name), flush=True)
+
+    DF = func(*args)
+
+    print("[+] Extracted {} Successfully".format(name), flush=True)
+    return DF
+
+
+class _Now:
+    """Result of a call made right away, used in place of a future when the
+    tables are extracted one by one
+    """
+
+    def __init__(self, func, *args):
+        self._value, self._error = None, None
+        try:
+            self._value = func(*args)
+        except Exception as e:
+            self._error = e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def _result(future, key, inputfiles):
+    """Returns the DataFrame of a table, and if the extraction of the table
+    failed, raises an error which tells which table it was
+    """
+    try:
+        return future.result()
+    except Exception as e:
+        source = inputfiles[key]
+        if not isinstance(source, str):
+            source = key
+        raise RuntimeError("Failed to extract {} ({}): {!r}".format(key, source, e)) from e
+
+
+def extractData(inputfiles, convertTemp=None, separatePhases=None, workers=1,
+                parseFormulas=False):
     """Wrapper function which calls all the required Data Extraction funcitons 
-    with required parameterse and returns all the necessary DataFrame
+    with required parameterse and returns all the necessary DataFrame.
+
+    With more than one worker, the tables are extracted concurrently in
+    separate processes (the parsers hold the GIL, hence threads do not run
+    them in parallel). system_main is extracted first, as phase_main needs
+    its F, and phase_main, the largest table, is started before the others.
     
     Arguments:
-        inputfiles {dict} -- Dictionary of all the input files
+        inputfiles {dict} -- Dictionary of all the input files, either their
+            paths or their lines (see readTable)
+
+    Keyword Arguments:
+        convertTemp {bool} -- Convert Temperatures from K to C, asked if None
+            (default: {None})
+        separatePhases {bool} -- Add a separate DataFrame for every Phase,
+            asked if None (default: {None})
+        workers {int} -- Number of processes extracting tables at once, at
+            most the number of CPUs; with 1 the tables are extracted one by
+            one in this process. Processes pay for starting and for pickling
+            the input lines and the DataFrames back, which made 4 processes
+            about twice as slow as 1 on a single CPU, hence they only help
+            with several CPUs (default: {1})
+        parseFormulas {bool} -- Add the stoichiometry of the solids parsed
+            from their Formula, as phase_formula (default: {False})
+
+    Returns:
+        dict -- the tables, along with 'assemblages' (see assemblageSegments)
     """
     # Guide to keys of data
     # 'phase_main', Done
@@ -389,116 +467,145 @@ def extractData(inputfiles):
     # 'trace_main', Not Yet
     # 'bulk_comp' Done [Generic]
 
-    print("[+] Extracting System Thermodynamic Data")
-    systemMain = extractSystemMain(inputfiles['system_main'])
-    F = systemMain['F'].values
-    print("[+] Extracted System Thermodynamic Data Successfully")
-
-    print("[+] Reading Phase Main Data")
-    phaseMain = extractPhaseMain(inputfiles['phase_main'], F)
-    print("[+] Read Phase Main Data successfully")
-
-    print("[+] Extracting Bulk Composition Data")
-    bulkComp = extractGeneric(inputfiles['bulk_comp'])
-    print("[+] Extracted Bulk Composition Data Successfully")
-
-    print("[+] Extracting Phase Mass data")
-    phaseMass = extractGeneric(inputfiles['phase_mass'])
-    print("[+] Extracted Phase Mass Data Successfully")
-
-    print("[+] Extract Solid Composition Data")
-    solidComp = extractSolidComp(inputfiles['solid_comp'])
-    print("[+] Extracted Solid Composition Data Successfully")
+    # Tables which depend only on the input files, phase_main also needs F
+    # from system_main
+    independent = (
+        ('bulk_comp', 'Bulk Composition Data', extractGeneric),
+        ('phase_mass', 'Phase Mass Data', extractGeneric),
+        ('solid_comp', 'Solid Composition Data', extractSolidComp),
+        ('phase_vol', 'Phase Volume Data', extractGeneric),
+    )
 
-    print("[+] Extracting Phase Volume Data")
-    phaseVol = extractGeneric(inputfiles['phase_vol'])
-    print("[+] Extracted Phase Volume Data Successfully")
+    workers = min(workers, os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    submit = pool.submit if pool else _Now
+    try:
+        systemMain = _result(
+            submit(_extract, 'System Thermodynamic Data', extractSystemMain,
+                   inputfiles['system_main']),
+            'system_main',
+            inputfiles
+        )
+        F = systemMain['F'].values
+
+        futures = {
+            'phase_main': submit(
+                _extract,
+                'Phase Main Data',
+                extractPhaseMain,
+                inputfiles['phase_main'],
+                F
+            )
+        }
+        for key, name, func in independent:
+            futures[key] = submit(_extract, name, func, inputfiles[key])
+
+        tables = {
+            key: _result(future, key, inputfiles)
+            for key, future in futures.items()
+        }
+    finally:
+        # If any table failed, the tables not yet started are not extracted
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    phaseMain = tables['phase_main']
 
     Data = {
         'phase_main': phaseMain,
-        'phase_mass': phaseMass,
-        'phase_vol': phaseVol,
-        'solid_comp': solidComp,
+        'phase_mass': tables['phase_mass'],
+        'phase_vol': tables['phase_vol'],
+        'solid_comp': tables['solid_comp'],
         'system_main': systemMain,
-        'bulk_comp': bulkComp
+        'bulk_comp': tables['bulk_comp']
     }
 
-    convertTemp = input("[?] Do you want to convert Temperatures to C from K (y/n): ")
-
-    if convertTemp.capitalize() == 'Y':
-        convertTemp = True
-    else:
-        convertTemp = False
+    if convertTemp is None:
+        convertTemp = askConvertTemp()
 
     if convertTemp: 
         for key in Data.keys():
             Data[key]['Temperature'] = Data[key]['Temperature'].astype(float) - 273.15
   
-    choice = input("[?] Do you want to create separate CSV files for every Phase? (y/n): ")
-    if choice.capitalize() == 'Y':
-        choice = True
-    else:
-        choice = False
+    # Assemblage segments, so that the phase plot does not have to read
+    # phase_main again
+    Data['assemblages'] = assemblageSegments(phaseMain)
 
-    phases = _separatePhaseFiles(phaseMain)
+    if parseFormulas:
+        phaseFormula = formulaTable(phaseMain)
+        if phaseFormula is not None:
+            Data['phase_formula'] = phaseFormula
 
-    if phases:
-        Data.update(phases)
+    if separatePhases is None:
+        separatePhases = askSeparatePhases()
+
+    if separatePhases:
+        phases = _separatePhaseFiles(phaseMain)
+
+        if phases:
+            Data.update(phases)
 
     return Data    
 
 
+def askConvertTemp():
+    convertTemp = input("[?] Do you want to convert Temperatures to C from K (y/n): ")
+
+    if convertTemp.capitalize() == 'Y':
+        return True
+    else:
+        return False
+
+
+def askSeparatePhases():
+    choice = input("[?] Do you want to create separate CSV files for every Phase? (y/n): ")
+    if choice.capitalize() == 'Y':
+        return True
+    else:
+        return False
+
+
 if __name__ == '__main__':
     # Input the location where the data files are present
+    mainpath, workers = None, 1
     if len(sys.argv) > 1:
-        mainpath = getArgs()
-    else:
+        mainpath, workers = getArgs()
+
+    if not mainpath:
         mainpath = input("[!] Enter path to Working Directory (Press ENTER for default): ")
         if mainpath == '':
             mainpath = '../'
     
-    # Check if path is valid
-    if not os.path.isdir(mainpath):
+    # Check if path is valid, the runs can also be stored in an archive
+    if not os.path.isdir(mainpath) and not isArchive(mainpath):
         print("[-] Working Directory doesn't exist; Exiting")
         sys.exit(2)
 
-    outputpath = mainpath + "/alphameltsData/output/{}/".format(
+    if os.path.isdir(mainpath):
+        workdir = mainpath
+    else:
+        workdir = extractDirName(os.path.abspath(mainpath)) + '/'
+
+    outputpath = workdir + "/alphameltsData/output/{}/".format(
         dt.now().strftime('%Y-%m-%d_%H-%M')
     )
 
-    phase_main = mainpath + "Phase_main_tbl.txt"
-    system_main = mainpath + "System_main_tbl.txt"
-    bulk_comp = mainpath + "Bulk_comp_tbl.txt"
-    liquid_comp = mainpath + "Liquid_comp_tbl.txt"  # redundant
-    solid_comp = mainpath + "Solid_comp_tbl.txt"
-    phase_mass = mainpath + "Phase_mass_tbl.txt"    # redundant
-    phase_vol = mainpath + "Phase_vol_tbl.txt"      # redundant
-    trace_main = mainpath + "Trace_main_tbl.txt"
-  
-    inputpaths = (
-        phase_main,
-        phase_mass,
-        phase_vol,
-        solid_comp,
-        system_main,
-        trace_main,
-        bulk_comp
-    )
-    inputnames = (
-        'phase_main',
-        'phase_mass',
-        'phase_vol',
-        'solid_comp',
-        'system_main',
-        'trace_main',
-        'bulk_comp'
-    )
+    convertTemp = askConvertTemp()
+    separatePhases = askSeparatePhases()
 
-    inputfiles = dict(zip(inputnames, inputpaths))
-    
-    Data = extractData(inputfiles)
+    # Either the tables in the working directory, or every run in the
+    # subdirectories or the archive
+    for name, inputfiles in iterRuns(mainpath):
+        if name == '.':
+            runOutput = outputpath
+        else:
+            print("[+] Processing run {}".format(name))
+            runOutput = os.path.join(outputpath, name, '')
+
+        Data = extractData(inputfiles, convertTemp, separatePhases, workers)
 
-    writeCSV(Data, outputpath)
+        writeCSV(Data, runOutput)
 
-    # Cleaning the directory
-    moveTables(mainpath, outputpath)
+        # Cleaning the directory
+        if os.path.isdir(mainpath):
+            moveTables(os.path.join(mainpath, name, ''), runOutput)
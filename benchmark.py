@@ -0,0 +1,657 @@
+from timeit import default_timer as timer
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+import pandas as pd
+import contextlib
+import subprocess
+import platform
+import tempfile
+import random
+import shutil
+import getopt
+import json
+import sys
+import io
+import os
+
+# From local file
+from beautifyData import extractPhaseMain, \
+                         extractSystemMain, \
+                         extractData
+from utils import writeCSV, \
+                  moveTables
+from runSource import readRun
+from tidyTables import readCSV, \
+                       tablePath
+from Plot import makePhasePlot, \
+                 readStepPath, \
+                 _plotfractionationScheme
+
+
+OXIDES = ('SiO2', 'TiO2', 'Al2O3', 'Fe2O3', 'FeO', 'MgO', 'CaO', 'Na2O', 'K2O', 'H2O')
+
+SOLIDS = (
+    'olivine', 'clinopyroxene', 'feldspar', 'spinel', 'orthopyroxene',
+    'quartz', 'garnet', 'amphibole', 'kfeldspar', 'aenigmatite', 'rhm-oxide',
+    'apatite', 'biotite', 'leucite', 'nepheline', 'whitlockite'
+)
+
+# Generated runs of the end to end benchmark: (steps, phases)
+CASES = {
+    'small': (200, 8),
+    'medium': (2000, 24),
+    'huge': (10000, 48),
+}
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Allowed slowdown (fraction of the baseline) of wall time and peak RSS
+TOLERANCE = {
+    'time': 0.25,
+    'rss': 0.25,
+}
+
+STAGES = ('extract', 'write', 'move', 'plotData', 'render')
+
+# Stages of the checked total. The rendering of the plots is left out, as it
+# is most of the time of the pipeline (and of its noise) and would hide a
+# slower extraction.
+CHECKED = ('extract', 'write', 'move', 'plotData')
+
+# Case run by test_benchmark.py, large enough for the extraction to be timed
+# reliably
+GATED = 'medium'
+
+# Set to 1 to skip the baseline check of test_benchmark.py
+OPTOUT = 'BENCHMARK_SKIP'
+
+
+def _phases(nphases):
+    """Names of the phases of a generated run, liquid_0 followed by solids,
+    solids are numbered again once all of them are used
+    """
+    solids = [
+        '{}_{}'.format(SOLIDS[i % len(SOLIDS)], i // len(SOLIDS))
+        for i in range(nphases - 1)
+    ]
+    return ['liquid_0'] + solids
+
+
+def _appears(nsteps, nphases):
+    """Step at which every phase of a generated run appears"""
+    return [int(nsteps * i / (nphases + 1)) for i in range(nphases)]
+
+
+def makeRun(path, nsteps, nphases, seed=0):
+    """Writes the tables of a synthetic fractional crystallisation run, in the
+    layout of alphaMELTS (phase_main is of type 1, one block per phase). Every
+    solid appears at a later step than the previous one, and then stays.
+
+    Arguments:
+        path {str} -- Directory where the tables are written
+        nsteps {int} -- Number of Temperature steps
+        nphases {int} -- Number of phases (blocks of phase_main)
+
+    Keyword Arguments:
+        seed {int} -- Seed of the random values (default: {0})
+
+    Returns:
+        int -- Total size of the tables in bytes
+    """
+    rnd = random.Random(seed)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    temperatures = ['{:.2f}'.format(1400.0 - i * 400.0 / nsteps) for i in range(nsteps)]
+    phases = _phases(nphases)
+    appears = _appears(nsteps, nphases)
+    oxides = ' '.join(OXIDES)
+
+    def composition():
+        return ' '.join('{:.4f}'.format(rnd.uniform(0, 50)) for _ in OXIDES)
+
+    def write(name, header, rows):
+        with open(os.path.join(path, name), 'w') as f:
+            f.write('Title: synthetic run\n\n')
+            f.write(header)
+            f.writelines(rows)
+
+    write(
+        'System_main_tbl.txt',
+        'System Thermodynamic Data: \nPressure Temperature mass F phi H S V Cp\n',
+        (
+            '1000.00 {} 100.0000 {:.4f} 0.0000 -1000.0000 10.0000 30.0000 12.0000\n'.format(
+                T, 1.0 if i == 0 else 0.995
+            )
+            for i, T in enumerate(temperatures)
+        )
+    )
+
+    blocks = []
+    for phase, start in zip(phases, appears):
+        if phase.startswith('liquid'):
+            header = 'Pressure Temperature mass S H V Cp viscosity ' + oxides
+        else:
+            header = 'Pressure Temperature mass S H V Cp formula ' + oxides
+
+        blocks.append('{} thermodynamic data and composition:\n{}\n'.format(phase, header))
+        for T in temperatures[start:]:
+            extra = '{:.3f}'.format(rnd.uniform(1, 5)) \
+                if phase.startswith('liquid') else 'Mg1.80Fe0.20SiO4'
+            blocks.append('1000.00 {} {:.4f} 1.0000 -100.0000 3.0000 1.5000 {} {}\n'.format(
+                T, rnd.uniform(0, 10), extra, composition()
+            ))
+        blocks.append('\n')
+    write('Phase_main_tbl.txt', '', blocks)
+
+    for name, title, quantity in (('Phase_mass_tbl.txt', 'Phase Masses:', 'mass'),
+                                  ('Phase_vol_tbl.txt', 'Phase Volumes:', 'volume')):
+        write(
+            name,
+            '{}\nPressure Temperature {} {}\n'.format(title, quantity, ' '.join(phases)),
+            (
+                '1000.00 {} 100.0000 {}\n'.format(T, ' '.join(
+                    '{:.4f}'.format(rnd.uniform(0, 10) if i >= start else 0.0)
+                    for start in appears
+                ))
+                for i, T in enumerate(temperatures)
+            )
+        )
+
+    write(
+        'Solid_comp_tbl.txt',
+        'Solid Composition:\nPressure Temperature mass {}\n'.format(oxides),
+        (
+            '1000.00 {} 5.0000 {}\n'.format(T, composition())
+            if nphases > 1 and i >= appears[1] else '1000.00 {} 0.0000 ---\n'.format(T)
+            for i, T in enumerate(temperatures)
+        )
+    )
+
+    write(
+        'Bulk_comp_tbl.txt',
+        'Bulk Composition:\nPressure Temperature mass {}\n'.format(oxides),
+        ('1000.00 {} 100.0000 {}\n'.format(T, composition()) for T in temperatures)
+    )
+
+    return sum(
+        os.path.getsize(os.path.join(path, f))
+        for f in os.listdir(path) if f.endswith('_tbl.txt')
+    )
+
+
+def benchPhaseMain(nsteps=2000, nphases=32, repeat=3):
+    """Times the extraction of a type 1 phase_main table, with one block per
+    phase, and returns the best time in seconds
+
+    Keyword Arguments:
+        nsteps {int} -- Number of Temperature steps (default: {2000})
+        nphases {int} -- Number of phase blocks (default: {32})
+        repeat {int} -- Number of times the extraction is timed (default: {3})
+    """
+    with tempfile.TemporaryDirectory() as path:
+        makeRun(path, nsteps, nphases)
+        F = extractSystemMain(os.path.join(path, 'System_main_tbl.txt'))['F'].values
+        phaseMain = os.path.join(path, 'Phase_main_tbl.txt')
+        size = os.path.getsize(phaseMain)
+
+        times = []
+        for _ in range(repeat):
+            start = timer()
+            DF = extractPhaseMain(phaseMain, F)
+            times.append(timer() - start)
+
+    problems = checkPhaseMain()
+    for problem in problems:
+        print("[-] phase_main does not match the generated run, {}".format(problem))
+
+    best = min(times)
+    print("[+] phase_main: {} steps, {} blocks, {} rows, {:.1f} MB".format(
+        nsteps, nphases, len(DF), size / 2**20
+    ))
+    print("[+] {:.3f} s, {:.0f} rows/s, {:.1f} MB/s".format(
+        best, len(DF) / best, size / 2**20 / best
+    ))
+
+    return best
+
+
+def checkPhaseMain(nsteps=200, nphases=8):
+    """Checks the extraction of a generated type 1 phase_main table against
+    the run it was generated from, the assemblage and F of every Temperature
+    have to be the same. The table is extracted once as written (ending with
+    a blank line) and once without the blank line after the last block.
+
+    Keyword Arguments:
+        nsteps {int} -- Number of Temperature steps (default: {200})
+        nphases {int} -- Number of phase blocks (default: {8})
+
+    Returns:
+        list -- description of every mismatch, empty if there is none
+    """
+    phases = _phases(nphases)
+    appears = _appears(nsteps, nphases)
+
+    problems = []
+    with tempfile.TemporaryDirectory() as path:
+        makeRun(path, nsteps, nphases)
+        systemMain = extractSystemMain(os.path.join(path, 'System_main_tbl.txt'))
+        F = systemMain['F'].to_numpy(dtype=float)
+        temperatures = systemMain['Temperature'].to_numpy(dtype=float)
+
+        phaseMain = os.path.join(path, 'Phase_main_tbl.txt')
+        with open(phaseMain) as f:
+            table = f.read()
+
+        for ending, text in (('blank line', table), ('no blank line', table.rstrip('\n') + '\n')):
+            with open(phaseMain, 'w') as f:
+                f.write(text)
+
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                DF = extractPhaseMain(phaseMain, F)
+
+            steps = DF.groupby('Temperature', sort=False)
+            assemblages = steps['Phase'].agg(frozenset)
+            stepF = steps['F'].first()
+
+            for i, T in enumerate(temperatures):
+                expected = frozenset(p for p, start in zip(phases, appears) if i >= start)
+                if assemblages.get(T) != expected:
+                    problems.append("{}: assemblage at {} is {}, expected {}".format(
+                        ending, T, sorted(assemblages.get(T, ())), sorted(expected)
+                    ))
+                elif stepF[T] != F[i]:
+                    problems.append("{}: F at {} is {}, expected {}".format(
+                        ending, T, stepF[T], F[i]
+                    ))
+
+            if len(assemblages) != len(temperatures):
+                problems.append("{}: {} Temperatures, expected {}".format(
+                    ending, len(assemblages), len(temperatures)
+                ))
+
+    return problems
+
+
+def peakRSS():
+    """Peak resident memory of the process in MB, None where the resource
+    module is not available (Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Bytes on macOS, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return rss / 2**20
+    return rss / 2**10
+
+
+def runPipeline(runDir, outputDir):
+    """Runs a run through beautifyData (extractData, writeCSV and moveTables)
+    and draws the plots of Plot.py from its output, without a display
+
+    Arguments:
+        runDir {str} -- Directory of the alphaMELTS tables, which are moved
+        outputDir {str} -- Directory where the CSV files are written
+
+    Returns:
+        dict -- wall time of every stage (see STAGES) in seconds
+    """
+    runDir = os.path.join(runDir, '')
+    outputDir = os.path.join(outputDir, '')
+    times = dict()
+
+    start = timer()
+    Data = extractData(readRun(runDir), convertTemp=False, separatePhases=False)
+    times['extract'] = timer() - start
+
+    start = timer()
+    writeCSV(Data, outputDir)
+    times['write'] = timer() - start
+
+    start = timer()
+    moveTables(runDir, outputDir)
+    times['move'] = timer() - start
+
+    start = timer()
+    segments = pd.read_csv(os.path.join(outputDir, 'assemblages.csv'))
+    path = readStepPath(outputDir)
+    bulkComp = readCSV(tablePath(outputDir, 'bulk_comp'))
+    times['plotData'] = timer() - start
+
+    start = timer()
+    for fig, ax in (makePhasePlot(segments, 'benchmark', path=path),
+                    _plotfractionationScheme(bulkComp, 'SiO2', 'MgO')):
+        fig.savefig(io.BytesIO(), format='png', bbox_inches='tight')
+        plt.close(fig)
+    times['render'] = timer() - start
+
+    return times
+
+
+def benchCase(case, repeat=1):
+    """Times the pipeline (see runPipeline) on a generated run, keeping the
+    fastest time of every stage over the repetitions. Should be run in a
+    process of its own (see runCase), as the peak RSS is the one of the whole
+    process.
+
+    Arguments:
+        case {str} -- Name of the generated run (see CASES)
+
+    Keyword Arguments:
+        repeat {int} -- Number of times the pipeline is run (default: {1})
+
+    Returns:
+        dict -- the times of the stages, the throughput and the peak RSS
+    """
+    nsteps, nphases = CASES[case]
+
+    with tempfile.TemporaryDirectory() as path:
+        source = os.path.join(path, 'source')
+        size = makeRun(source, nsteps, nphases) / 2**20
+
+        best = None
+        for i in range(repeat):
+            runDir = os.path.join(path, 'run{}'.format(i))
+            shutil.copytree(source, runDir)
+
+            # The pipeline reports every table it writes and moves
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                times = runPipeline(runDir, os.path.join(path, 'output{}'.format(i)))
+
+            if best is None:
+                best = times
+            else:
+                best = {stage: min(best[stage], times[stage]) for stage in best}
+
+            shutil.rmtree(runDir)
+            shutil.rmtree(os.path.join(path, 'output{}'.format(i)))
+
+    total = sum(best.values())
+    return {
+        'steps': nsteps,
+        'phases': nphases,
+        'repeat': repeat,
+        'size': size,
+        'stages': best,
+        'total': total,
+        'checkedTotal': sum(best[stage] for stage in CHECKED),
+        'extractStepsPerSecond': nsteps / best['extract'],
+        'stepsPerSecond': nsteps / total,
+        'MBPerSecond': size / total,
+        'peakRSS': peakRSS(),
+    }
+
+
+def runCase(case, repeat=1):
+    """Runs benchCase in a new Python process, so that the peak RSS of every
+    case is measured on its own
+    """
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--case', case, '-n', str(repeat)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError("Benchmark {} failed:\n{}".format(case, process.stderr))
+
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def printResult(case, result):
+    print("[+] {}: {} steps, {} phases, {:.1f} MB".format(
+        case, result['steps'], result['phases'], result['size']
+    ))
+    print("    " + ", ".join(
+        "{} {:.3f} s".format(stage, result['stages'][stage]) for stage in STAGES
+    ))
+    print("    total {:.3f} s ({:.3f} s without render), extract {:.0f} steps/s".format(
+        result['total'], result['checkedTotal'], result['extractStepsPerSecond']
+    ))
+    print("    {:.0f} steps/s, {:.1f} MB/s, peak RSS {}".format(
+        result['stepsPerSecond'],
+        result['MBPerSecond'],
+        '{:.0f} MB'.format(result['peakRSS']) if result['peakRSS'] else 'n/a'
+    ))
+
+
+def machineKey():
+    """Key of the baselines of this machine, made of the OS, the CPU model and
+    count and the Python version (and not of the hostname, which changes
+    between CI runners of the same kind)
+    """
+    cpu = platform.processor()
+    if os.path.isfile('/proc/cpuinfo'):
+        with open('/proc/cpuinfo') as f:
+            cpu = next(
+                (line.split(':', 1)[1].strip() for line in f if line.startswith('model name')),
+                cpu
+            )
+
+    return '{} {} {} x{} python{}'.format(
+        platform.system(),
+        platform.machine(),
+        cpu or 'unknown cpu',
+        os.cpu_count(),
+        '.'.join(platform.python_version_tuple()[:2])
+    )
+
+
+def readBaseline(path=BASELINE):
+    """Reads the stored baselines, one for every machine key (see
+    machineKey), None if there are none
+    """
+    if not os.path.isfile(path):
+        return None
+
+    with open(path) as f:
+        baselines = json.load(f)
+
+    return baselines.get('machines')
+
+
+def baselineFor(baselines, key=None):
+    """Baseline of a machine, None if there is none
+
+    Arguments:
+        baselines {dict} -- Stored baselines (see readBaseline), or None
+
+    Keyword Arguments:
+        key {str} -- Machine key, the one of this machine if None
+            (default: {None})
+    """
+    if not baselines:
+        return None
+
+    return baselines.get(key or machineKey())
+
+
+def writeBaseline(results, path=BASELINE, tolerance=None):
+    """Stores the results as the baseline of this machine. Cases which were
+    not run, and the baselines of the other machines, are kept.
+
+    Arguments:
+        results {dict} -- Name of the case: result of benchCase
+
+    Keyword Arguments:
+        path {str} -- Path of the baselines (default: {BASELINE})
+        tolerance {dict} -- Tolerances stored with the baseline, those of the
+            previous baseline (or TOLERANCE) if None (default: {None})
+    """
+    baselines = readBaseline(path) or dict()
+    key = machineKey()
+
+    baseline = baselines.setdefault(key, {'tolerance': dict(TOLERANCE), 'cases': {}})
+    if tolerance:
+        baseline['tolerance'].update(tolerance)
+
+    baseline['cases'].update(results)
+    baseline['platform'] = platform.platform()
+    baseline['python'] = platform.python_version()
+
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'machines': baselines}, f, indent=1, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp, path)
+
+    print("[+] Baseline of {} written at: {}".format(key, path))
+
+
+def checkRegressions(results, baseline, tolerance=None):
+    """Compares the results against the baseline, and returns a description
+    of every regression (an empty list if there is none). The throughput of
+    the extraction (steps/s), the total time without the rendering of the
+    plots (see CHECKED) and the peak RSS are checked relatively to the
+    baseline, and a case without baseline is a regression as well.
+
+    Arguments:
+        results {dict} -- Name of the case: result of benchCase
+        baseline {dict} -- Baseline of this machine (see baselineFor)
+
+    Keyword Arguments:
+        tolerance {dict} -- Overrides the tolerances of the baseline
+            (default: {None})
+    """
+    tol = dict(TOLERANCE)
+    tol.update(baseline.get('tolerance', {}))
+    tol.update(tolerance or {})
+
+    regressions = []
+    for case, result in results.items():
+        base = baseline['cases'].get(case)
+        if base is None:
+            regressions.append("{}: no baseline, create it with -u -c {}".format(case, case))
+            continue
+        if base.get('repeat') != result['repeat']:
+            # The peak RSS grows with the number of repetitions
+            print("[-] {} was run {} times for the baseline, and {} times now".format(
+                case, base.get('repeat'), result['repeat']
+            ))
+
+        current, previous = result['extractStepsPerSecond'], base['extractStepsPerSecond']
+        if current * (1 + tol['time']) < previous:
+            regressions.append("{} extract: {:.0f} steps/s, baseline {:.0f} steps/s ({:.0%})".format(
+                case, current, previous, current / previous - 1
+            ))
+
+        current, previous = result['checkedTotal'], base['checkedTotal']
+        if current > previous * (1 + tol['time']):
+            regressions.append("{} total without render: {:.3f} s, baseline {:.3f} s (+{:.0%})".format(
+                case, current, previous, current / previous - 1
+            ))
+
+        if result['peakRSS'] and base.get('peakRSS') \
+                and result['peakRSS'] > base['peakRSS'] * (1 + tol['rss']):
+            regressions.append("{} peak RSS: {:.0f} MB, baseline {:.0f} MB (+{:.0%})".format(
+                case, result['peakRSS'], base['peakRSS'], result['peakRSS'] / base['peakRSS'] - 1
+            ))
+
+    return regressions
+
+
+def getArgs():
+    """Reads the benchmark and its options from the arguments"""
+    usage = (
+        '{0} -s <steps> -p <phases>\n'
+        '{0} -e [-c <case,...>] [-n <repeat>] [-u | -k] [-b <baseline>] '
+        '[-t <time tolerance>] [-r <rss tolerance>]'
+    ).format(sys.argv[0])
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            "s:p:ec:n:ukb:t:r:",
+            ["steps=", "phases=", "pipeline", "cases=", "repeat=", "update",
+             "check", "baseline=", "time-tolerance=", "rss-tolerance=", "case="]
+        )
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+
+    options = {
+        'steps': 2000,
+        'phases': 32,
+        'pipeline': False,
+        'cases': list(CASES),
+        'repeat': 5,
+        'update': False,
+        'check': False,
+        'baseline': BASELINE,
+        'tolerance': dict(),
+        'case': None,
+    }
+    for opt, arg in opts:
+        if opt in ("-s", "--steps"):
+            options['steps'] = int(arg)
+        elif opt in ("-p", "--phases"):
+            options['phases'] = int(arg)
+        elif opt in ("-e", "--pipeline"):
+            options['pipeline'] = True
+        elif opt in ("-c", "--cases"):
+            options['cases'] = arg.split(',')
+        elif opt in ("-n", "--repeat"):
+            options['repeat'] = int(arg)
+        elif opt in ("-u", "--update"):
+            options['pipeline'] = options['update'] = True
+        elif opt in ("-k", "--check"):
+            options['pipeline'] = options['check'] = True
+        elif opt in ("-b", "--baseline"):
+            options['baseline'] = arg
+        elif opt in ("-t", "--time-tolerance"):
+            options['tolerance']['time'] = float(arg)
+        elif opt in ("-r", "--rss-tolerance"):
+            options['tolerance']['rss'] = float(arg)
+        elif opt == "--case":
+            options['case'] = arg
+
+    unknown = [case for case in options['cases'] if case not in CASES]
+    if unknown:
+        print("[-] Unknown cases: {} (available: {})".format(
+            ", ".join(unknown), ", ".join(CASES)
+        ))
+        sys.exit(2)
+
+    return options
+
+
+if __name__ == '__main__':
+    options = getArgs()
+
+    if options['case']:
+        # Single case, run by runCase in a process of its own
+        print(json.dumps(benchCase(options['case'], options['repeat'])))
+        sys.exit(0)
+
+    if not options['pipeline']:
+        benchPhaseMain(options['steps'], options['phases'])
+        sys.exit(0)
+
+    baselines = readBaseline(options['baseline'])
+    baseline = baselineFor(baselines)
+    if options['check'] and baseline is None:
+        print("[-] No baseline of {} at {}, create one with -u (baselines of: {})".format(
+            machineKey(), options['baseline'], ", ".join(baselines or ()) or "none"
+        ))
+        sys.exit(2)
+
+    results = dict()
+    for case in options['cases']:
+        results[case] = runCase(case, options['repeat'])
+        printResult(case, results[case])
+
+    if options['check']:
+        regressions = checkRegressions(results, baseline, options['tolerance'])
+        if regressions:
+            for regression in regressions:
+                print("[-] Regression: {}".format(regression))
+            sys.exit(1)
+        print("[+] No regressions against the baseline")
+
+    if options['update']:
+        writeBaseline(results, options['baseline'], options['tolerance'])
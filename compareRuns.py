@@ -0,0 +1,322 @@
+import numpy as np
+import pandas as pd
+import getopt
+import sys
+
+# From local file
+from tidyTables import tablePath, \
+                       readCSV
+
+
+# Tables which have one row per step, and are compared column by column
+STEPTABLES = ('system_main', 'phase_mass', 'bulk_comp')
+
+
+def loadRun(path, tables=STEPTABLES + ('phase_main',)):
+    """Reads the CSV files of a run, as written by beautifyData
+
+    Arguments:
+        path {str} -- Output directory of the run
+
+    Keyword Arguments:
+        tables {tuple} -- Names of the tables to be read
+    """
+    Data = dict()
+    for table in tables:
+        fpath = tablePath(path, table)
+        if fpath:
+            Data[table] = readCSV(fpath, index_col=0)
+
+    return Data
+
+
+class Steps:
+    """Numeric columns of a table, sorted on the column the runs are aligned
+    on. Sorting is done only once, hence a baseline can be compared against
+    any number of variants cheaply.
+
+    Arguments:
+        DF {DataFrame} -- Table with one row per step
+        on {str} -- Column to align on (Temperature or Pressure)
+    """
+
+    def __init__(self, DF, on):
+        numeric = DF.apply(pd.to_numeric, errors='coerce').dropna(axis=1, how='all')
+        key = numeric[on].to_numpy(dtype=float)
+        order = np.argsort(key, kind='stable')
+
+        self.on = on
+        self.key = key[order]
+        self.columns = [col for col in numeric.columns if col != on]
+        self.values = numeric[self.columns].to_numpy(dtype=float)[order]
+
+    def column(self, name):
+        """Values of a column, zeros if the run does not have the column (a
+        phase which never appeared, or an oxide which is absent)
+        """
+        if name in self.columns:
+            return self.values[:, self.columns.index(name)]
+        return np.zeros(len(self.key))
+
+
+def align(base, other, columns, method='merge', tol=1e-6):
+    """Returns the values of the columns of `other` at the steps of `base`.
+    Steps of base without a matching step in other are NaN.
+
+    Arguments:
+        base {Steps} -- Steps to align on
+        other {Steps} -- Steps to be aligned
+        columns {list} -- Columns to align
+
+    Keyword Arguments:
+        method {str} -- 'merge' matches steps with equal keys (within tol),
+            'interpolate' linearly interpolates other onto the keys of base
+            (default: {'merge'})
+        tol {float} -- Largest difference of keys considered equal
+            (default: {1e-6})
+    """
+    values = np.column_stack([other.column(col) for col in columns]) \
+        if columns else np.empty((len(other.key), 0))
+
+    n = len(other.key)
+    if n == 0:
+        return np.full((len(base.key), len(columns)), np.nan)
+
+    right = np.clip(np.searchsorted(other.key, base.key), 0, n - 1)
+    left = np.clip(right - 1, 0, n - 1)
+
+    if method == 'merge':
+        nearest = np.where(
+            np.abs(other.key[left] - base.key) < np.abs(other.key[right] - base.key),
+            left,
+            right
+        )
+        aligned = values[nearest]
+        aligned[np.abs(other.key[nearest] - base.key) > tol] = np.nan
+    elif method == 'interpolate':
+        span = other.key[right] - other.key[left]
+        weight = np.divide(
+            base.key - other.key[left],
+            span,
+            out=np.zeros(len(base.key)),
+            where=span != 0
+        )
+        aligned = values[left] * (1 - weight[:, None]) \
+            + values[right] * weight[:, None]
+
+        outside = (base.key < other.key[0] - tol) | (base.key > other.key[-1] + tol)
+        aligned[outside] = np.nan
+    else:
+        raise ValueError("Unknown method: {}".format(method))
+
+    return aligned
+
+
+def diffTable(base, other, method='merge', tol=1e-6):
+    """Returns the difference (other - base) of every column, at the steps of
+    base
+
+    Arguments:
+        base {Steps} -- Steps of the baseline
+        other {Steps} -- Steps of the run compared to the baseline
+    """
+    columns = base.columns + [col for col in other.columns if col not in base.columns]
+    baseValues = np.column_stack([base.column(col) for col in columns])
+
+    delta = align(base, other, columns, method, tol) - baseValues
+
+    DF = pd.DataFrame(delta, columns=columns)
+    DF.insert(0, base.on, base.key)
+
+    # Runs go from high to low Temperature (or Pressure)
+    return DF.iloc[::-1].reset_index(drop=True)
+
+
+def assemblages(phaseMain, on):
+    """Returns the sorted steps of a run, and the assemblage at every step
+
+    Arguments:
+        phaseMain {DataFrame} -- phase_main table
+        on {str} -- Column to align on
+    """
+    key = pd.to_numeric(phaseMain[on]).to_numpy(dtype=float)
+    steps = pd.Series(phaseMain['Phase'].to_numpy()).groupby(key).agg(frozenset)
+
+    return steps.index.to_numpy(dtype=float), steps.to_numpy()
+
+
+def firstDivergence(base, other, tol=1e-6):
+    """Returns the first step (along the path, from high to low) where the
+    assemblages of two runs are different, as (step, base assemblage, other
+    assemblage), None if they never differ
+
+    Arguments:
+        base {tuple} -- steps and assemblages of the baseline, as returned by
+            assemblages
+        other {tuple} -- steps and assemblages of the other run
+    """
+    baseKey, baseSets = base
+    otherKey, otherSets = other
+
+    n = len(otherKey)
+    if n == 0:
+        # The other run has no steps, it diverges at the first step of base
+        if len(baseKey) == 0:
+            return None
+        return baseKey[-1], baseSets[-1], frozenset()
+
+    idx = np.clip(np.searchsorted(otherKey, baseKey), 0, n - 1)
+    matched = np.abs(otherKey[idx] - baseKey) <= tol
+
+    for i in range(len(baseKey) - 1, -1, -1):
+        otherSet = otherSets[idx[i]] if matched[i] else frozenset()
+        if baseSets[i] != otherSet:
+            return baseKey[i], baseSets[i], otherSet
+
+    return None
+
+
+def compareRuns(base, other, on='Temperature', method='merge', tol=1e-6):
+    """Compares two runs step by step
+
+    Arguments:
+        base {dict} -- Tables of the baseline (see loadRun)
+        other {dict} -- Tables of the run compared to the baseline
+
+    Keyword Arguments:
+        on {str} -- Column to align on (default: {'Temperature'})
+        method {str} -- 'merge' or 'interpolate' (default: {'merge'})
+        tol {float} -- Largest difference of keys considered equal
+
+    Returns:
+        dict -- per-step deltas of every table, and 'divergence' as returned
+            by firstDivergence
+    """
+    result = dict()
+    for table in STEPTABLES:
+        if table in base and table in other:
+            result[table] = diffTable(
+                Steps(base[table], on),
+                Steps(other[table], on),
+                method,
+                tol
+            )
+
+    if 'phase_main' in base and 'phase_main' in other:
+        result['divergence'] = firstDivergence(
+            assemblages(base['phase_main'], on),
+            assemblages(other['phase_main'], on),
+            tol
+        )
+
+    return result
+
+
+def compareMany(base, variants, on='Temperature', method='merge', tol=1e-6):
+    """Compares one baseline against many variants. The baseline is sorted
+    only once, and the variants are read one at a time.
+
+    Arguments:
+        base {dict} -- Tables of the baseline (see loadRun)
+        variants {dict} -- Name of the variant: tables of the variant, or the
+            path of its output directory
+
+    Returns:
+        DataFrame -- one row per variant, with the largest absolute delta of
+            every column, and the first step where the assemblages diverge
+    """
+    baseSteps = {
+        table: Steps(base[table], on) for table in STEPTABLES if table in base
+    }
+    baseSets = assemblages(base['phase_main'], on) if 'phase_main' in base else None
+
+    rows = []
+    for name, variant in variants.items():
+        if isinstance(variant, str):
+            variant = loadRun(variant)
+
+        row = {'Run': name}
+        for table, steps in baseSteps.items():
+            if table not in variant:
+                continue
+            delta = diffTable(steps, Steps(variant[table], on), method, tol)
+            maxDelta = delta.drop(columns=[on]).abs().max()
+            row.update({
+                '{}:{}'.format(table, col): value
+                for col, value in maxDelta.items()
+            })
+
+        if baseSets is not None and 'phase_main' in variant:
+            divergence = firstDivergence(
+                baseSets,
+                assemblages(variant['phase_main'], on),
+                tol
+            )
+            row['Divergence'] = divergence[0] if divergence else None
+
+        rows.append(row)
+
+    return pd.DataFrame(rows).set_index('Run')
+
+
+def getArgs():
+    """Reads the baseline, the variants and the options from the arguments"""
+    usage = '{} -b <baseline> [-o <output.csv>] [-p] [-n] <variant> ...'.format(sys.argv[0])
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            "b:o:pn",
+            ["baseline=", "output=", "pressure", "interpolate"]
+        )
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+
+    baseline, output, on, method = None, None, 'Temperature', 'merge'
+    for opt, arg in opts:
+        if opt in ("-b", "--baseline"):
+            baseline = arg
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt in ("-p", "--pressure"):
+            on = 'Pressure'
+        elif opt in ("-n", "--interpolate"):
+            method = 'interpolate'
+
+    if not baseline or not args:
+        print(usage)
+        sys.exit(2)
+
+    return baseline, args, output, on, method
+
+
+if __name__ == '__main__':
+    baseline, variants, output, on, method = getArgs()
+
+    base = loadRun(baseline)
+
+    if len(variants) == 1:
+        result = compareRuns(base, loadRun(variants[0]), on, method)
+
+        divergence = result.pop('divergence', None)
+        if divergence:
+            step, baseSet, otherSet = divergence
+            print("[+] Assemblages diverge at {} = {}".format(on, step))
+            print("    {}: {}".format(baseline, " + ".join(sorted(baseSet))))
+            print("    {}: {}".format(variants[0], " + ".join(sorted(otherSet))))
+        else:
+            print("[+] Assemblages are identical at all the steps")
+
+        DF = pd.concat(
+            [delta.set_index(on) for delta in result.values()],
+            axis=1,
+            keys=list(result.keys())
+        )
+    else:
+        DF = compareMany(base, dict(zip(variants, variants)), on, method)
+
+    if output:
+        print("[+] Writing CSV at: {}".format(output))
+        DF.to_csv(output)
+    else:
+        print(DF.to_string())
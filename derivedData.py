@@ -0,0 +1,384 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+# Oxides, in the order alphaMELTS writes them, which are considered while
+# computing compositional quantities
+OXIDES = (
+    'SiO2', 'TiO2', 'Al2O3', 'Fe2O3', 'Cr2O3', 'FeO', 'MnO', 'MgO', 'NiO',
+    'CoO', 'CaO', 'Na2O', 'K2O', 'P2O5', 'H2O', 'CO2'
+)
+VOLATILES = ('H2O', 'CO2')
+
+# Molar masses (g/mol) used for Mg#
+MOLAR_MASS = {
+    'MgO': 40.304,
+    'FeO': 71.844,
+    'Fe2O3': 159.688
+}
+
+# Columns which identify a step, these are carried over to every result
+KEYCOLUMNS = ('Pressure', 'Temperature')
+
+
+def phaseColumns(DF):
+    """Returns the columns of a table which hold per-phase values, alphaMELTS
+    names them as <phase>_<n> (liquid_0, olivine_1, ...)
+
+    Arguments:
+        DF {DataFrame} -- phase_mass or phase_vol table
+    """
+    return [col for col in DF.columns if re.match(r'^[A-Za-z\-]+_[0-9]+$', col)]
+
+
+def oxideColumns(DF):
+    """Returns the oxide columns present in the table, in the order of the
+    table
+
+    Arguments:
+        DF {DataFrame} -- solid_comp or bulk_comp table
+    """
+    return [col for col in DF.columns if col in OXIDES]
+
+
+def _numeric(DF, columns):
+    """Converts the given (string typed) columns of the DataFrame to a 2-D
+    float array. Missing values are treated as 0
+    """
+    values = DF[list(columns)].apply(pd.to_numeric, errors='coerce')
+    return values.fillna(0.0).to_numpy(dtype=float)
+
+
+def _keys(DF):
+    """Returns the columns identifying every step, as a new DataFrame of
+    numbers (the tables hold them as parsed, as strings)
+    """
+    columns = [col for col in KEYCOLUMNS if col in DF.columns]
+    return DF[columns].apply(pd.to_numeric, errors='coerce')
+
+
+def _groupStarts(groups):
+    """Returns the position of the first row of every group, groups being an
+    array of labels where rows of a group are contiguous
+    """
+    if groups is None:
+        return np.array([0])
+
+    groups = np.asarray(groups)
+    changes = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+    return np.concatenate(([0], changes))
+
+
+def _groupCumsum(values, groups):
+    """Cumulative sum along the rows of a 2-D array, which restarts at the
+    beginning of every group
+
+    Arguments:
+        values {ndarray} -- 2-D array of values
+        groups {array} -- Label of every row, None if all rows are one group
+    """
+    cum = np.cumsum(values, axis=0)
+    if groups is None or len(values) == 0:
+        return cum
+
+    starts = _groupStarts(groups)
+    lengths = np.diff(np.append(starts, len(values)))
+
+    # Total of all previous groups, which has to be removed from every row
+    offsets = np.zeros((len(starts), values.shape[1]))
+    offsets[1:] = cum[starts[1:] - 1]
+
+    return cum - np.repeat(offsets, lengths, axis=0)
+
+
+def _groupFirst(values, groups):
+    """Broadcasts the first row of every group to all the rows of the group"""
+    starts = _groupStarts(groups)
+    lengths = np.diff(np.append(starts, len(values)))
+
+    return np.repeat(values[starts], lengths, axis=0)
+
+
+def phaseProportions(phaseMass, groups=None):
+    """Returns the proportion of every phase in the system, for every step
+
+    Arguments:
+        phaseMass {DataFrame} -- phase_mass table
+
+    Keyword Arguments:
+        groups {array} -- Run label of every row, for batches (default: {None})
+    """
+    phases = phaseColumns(phaseMass)
+    masses = _numeric(phaseMass, phases)
+    total = masses.sum(axis=1, keepdims=True)
+
+    proportions = np.divide(
+        masses,
+        total,
+        out=np.zeros_like(masses),
+        where=total > 0
+    )
+
+    DF = _keys(phaseMass)
+    DF[phases] = proportions
+    return DF
+
+
+def cumulativeSolids(phaseMass, groups=None):
+    """Returns the cumulative mass of every solid phase fractionated from the
+    system, along with their total
+
+    Arguments:
+        phaseMass {DataFrame} -- phase_mass table
+
+    Keyword Arguments:
+        groups {array} -- Run label of every row, for batches (default: {None})
+    """
+    solids = [p for p in phaseColumns(phaseMass) if not p.startswith('liquid')]
+    cumulative = _groupCumsum(_numeric(phaseMass, solids), groups)
+
+    DF = _keys(phaseMass)
+    DF[solids] = cumulative
+    DF['Total'] = cumulative.sum(axis=1)
+    return DF
+
+
+def mgNumber(comp, groups=None):
+    """Returns the molar Mg# (100 * Mg / (Mg + Fe total)) of a composition
+
+    Arguments:
+        comp {DataFrame} -- solid_comp or bulk_comp table
+
+    Keyword Arguments:
+        groups {array} -- Run label of every row, for batches (default: {None})
+    """
+    oxides = [ox for ox in ('MgO', 'FeO', 'Fe2O3') if ox in comp.columns]
+    values = dict(zip(oxides, _numeric(comp, oxides).T))
+    zeros = np.zeros(len(comp))
+
+    mg = values.get('MgO', zeros) / MOLAR_MASS['MgO']
+    fe = values.get('FeO', zeros) / MOLAR_MASS['FeO'] \
+        + 2 * values.get('Fe2O3', zeros) / MOLAR_MASS['Fe2O3']
+
+    total = mg + fe
+    mgNo = np.divide(100 * mg, total, out=np.full(len(comp), np.nan), where=total > 0)
+
+    DF = _keys(comp)
+    DF['Mg#'] = mgNo
+    return DF
+
+
+def normalizedOxides(comp, groups=None, anhydrous=True):
+    """Returns the oxides of a composition normalised to 100 wt%, which gives
+    the liquid line of descent, when used with bulk_comp
+
+    Arguments:
+        comp {DataFrame} -- solid_comp or bulk_comp table
+
+    Keyword Arguments:
+        groups {array} -- Run label of every row, for batches (default: {None})
+        anhydrous {bool} -- Leave out volatiles while normalising
+            (default: {True})
+    """
+    oxides = oxideColumns(comp)
+    if anhydrous:
+        oxides = [ox for ox in oxides if ox not in VOLATILES]
+
+    values = _numeric(comp, oxides)
+    total = values.sum(axis=1, keepdims=True)
+
+    normalized = np.divide(
+        100 * values,
+        total,
+        out=np.full_like(values, np.nan),
+        where=total > 0
+    )
+
+    DF = _keys(comp)
+    DF[oxides] = normalized
+    return DF
+
+
+def massBalance(systemMain, phaseMass, groups=None):
+    """Checks the mass balance of a fractionation run, the initial mass of the
+    system should be equal to the mass left in the system and the mass of the
+    fractionated solids
+
+    Arguments:
+        systemMain {DataFrame} -- system_main table
+        phaseMass {DataFrame} -- phase_mass table
+
+    Keyword Arguments:
+        groups {array} -- Run label of every row, for batches (default: {None})
+    """
+    if len(systemMain) != len(phaseMass):
+        raise ValueError(
+            "system_main and phase_mass have different number of steps "
+            "({} and {})".format(len(systemMain), len(phaseMass))
+        )
+
+    systemMass = _numeric(systemMain, ['mass'])
+    initial = _groupFirst(systemMass, groups)
+    fractionated = cumulativeSolids(phaseMass, groups)['Total'].to_numpy()
+
+    # Solids of a step are removed only after the step, hence the mass in
+    # system at a step is balanced by the solids upto the previous step
+    previous = fractionated - _numeric(
+        phaseMass,
+        [p for p in phaseColumns(phaseMass) if not p.startswith('liquid')]
+    ).sum(axis=1)
+
+    DF = _keys(systemMain)
+    DF['SystemMass'] = systemMass[:, 0]
+    DF['Fractionated'] = previous
+    DF['Residual'] = initial[:, 0] - systemMass[:, 0] - previous
+    return DF
+
+
+def assemblageSegments(phaseMain):
+    """Splits the path of a run into segments of constant assemblage. Steps
+    are the distinct Temperatures of phase_main, in the order of the table.
+    A segment ends at the first step of the next segment (or at the last
+    step), which is where the polygons of the phase plot are closed.
+
+    Arguments:
+        phaseMain {DataFrame} -- phase_main table, with its F column
+
+    Returns:
+        DataFrame -- one row per segment, with the phases (joined by ' + '),
+            the first and last step, and Temperature and F at both of them
+    """
+    stepCodes, temperatures = pd.factorize(pd.to_numeric(phaseMain['Temperature']))
+    phaseCodes, phases = pd.factorize(phaseMain['Phase'])
+    nsteps = len(temperatures)
+
+    columns = ['Segment', 'Phases', 'StepStart', 'StepEnd', 'TStart', 'TEnd', 'FStart', 'FEnd']
+    if nsteps == 0:
+        return pd.DataFrame(columns=columns)
+
+    presence = np.zeros((nsteps, len(phases)), dtype=bool)
+    presence[stepCodes, phaseCodes] = True
+
+    # F of the first row of every step
+    _, firstRows = np.unique(stepCodes, return_index=True)
+    F = pd.to_numeric(phaseMain['F']).to_numpy(dtype=float)[firstRows]
+
+    starts = np.concatenate((
+        [0],
+        np.flatnonzero((presence[1:] != presence[:-1]).any(axis=1)) + 1
+    ))
+    ends = np.append(starts[1:], nsteps - 1)
+
+    T = temperatures.to_numpy(dtype=float)
+    names = np.asarray(phases, dtype=object)
+
+    return pd.DataFrame({
+        'Segment': np.arange(len(starts)),
+        'Phases': [" + ".join(names[presence[start]]) for start in starts],
+        'StepStart': starts,
+        'StepEnd': ends,
+        'TStart': T[starts],
+        'TEnd': T[ends],
+        'FStart': F[starts],
+        'FEnd': F[ends],
+    }, columns=columns)
+
+
+# Name of the derived quantity: (function, tables required by the function)
+DERIVATIONS = {
+    'phase_proportions': (phaseProportions, ('phase_mass',)),
+    'cumulative_solids': (cumulativeSolids, ('phase_mass',)),
+    'solid_mg_number': (mgNumber, ('solid_comp',)),
+    'bulk_mg_number': (mgNumber, ('bulk_comp',)),
+    'solid_oxides': (normalizedOxides, ('solid_comp',)),
+    'liquid_line_of_descent': (normalizedOxides, ('bulk_comp',)),
+    'mass_balance': (massBalance, ('system_main', 'phase_mass')),
+}
+
+
+class DerivedRun:
+    """Computes the derived quantities of a single run on demand, and caches
+    them. A cached quantity is recomputed if any of the tables it is derived
+    from has been replaced since (see setTable). Tables modified in place are
+    not detected, the cache has to be invalidated for them.
+
+    Arguments:
+        Data {dict} -- dictionary of DataFrames, as returned by extractData
+    """
+
+    def __init__(self, Data):
+        self.Data = Data
+        self._cache = dict()
+        self._versions = dict()
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def get(self, name):
+        func, tables = DERIVATIONS[name]
+        sources = [self.Data[table] for table in tables]
+        versions = tuple(self._versions.get(table, 0) for table in tables)
+
+        # The cache holds the source tables themselves, compared by identity,
+        # as ids of tables which have been garbage collected are reused
+        cached = self._cache.get(name)
+        if cached is not None and cached[1] == versions \
+                and all(old is new for old, new in zip(cached[0], sources)):
+            return cached[2]
+
+        result = func(*sources)
+        self._cache[name] = (sources, versions, result)
+        return result
+
+    def all(self):
+        """Returns a dictionary of all the derived quantities which can be
+        computed from the tables present in the run
+        """
+        return {
+            name: self.get(name)
+            for name, (_, tables) in DERIVATIONS.items()
+            if all(table in self.Data for table in tables)
+        }
+
+    def setTable(self, table, DF):
+        """Replaces a table of the run, the quantities derived from it are
+        recomputed when they are next requested
+        """
+        self.Data[table] = DF
+        self._versions[table] = self._versions.get(table, 0) + 1
+
+    def invalidate(self, name=None):
+        if name is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(name, None)
+
+
+def deriveBatch(runs, name):
+    """Computes one derived quantity for a batch of runs in a single pass. The
+    tables of all the runs are stacked, and cumulative quantities restart at
+    the first step of every run.
+
+    Arguments:
+        runs {dict} -- Name of the run: Data dictionary of the run
+        name {str} -- Name of the derived quantity (see DERIVATIONS)
+
+    Returns:
+        DataFrame -- indexed by (Run, step)
+    """
+    func, tables = DERIVATIONS[name]
+    names = list(runs.keys())
+
+    sources = []
+    for table in tables:
+        stacked = pd.concat(
+            [runs[run][table].reset_index(drop=True) for run in names],
+            keys=names,
+            names=['Run', 'Step'],
+            sort=False
+        )
+        sources.append(stacked)
+
+    groups = sources[0].index.get_level_values('Run')
+    return func(*sources, groups=groups)
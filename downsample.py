@@ -0,0 +1,124 @@
+import numpy as np
+
+
+def lttb(x, y, budget):
+    """Largest-Triangle-Three-Buckets downsampling. Selects the indices of at
+    most `budget` points which preserve the visual shape of the line, the
+    first and the last points are always kept.
+
+    Arguments:
+        x {array} -- X values of the line
+        y {array} -- Y values of the line
+        budget {int} -- Maximum number of points to keep
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+
+    if budget is None or n <= budget or budget < 3:
+        return np.arange(n)
+
+    # Every point except the first and the last is put into one of the
+    # buckets, one point is selected from each bucket
+    edges = np.linspace(1, n - 1, budget - 1).astype(int)
+
+    selected = np.empty(budget, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(budget - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average of the next bucket, is the third vertex of the triangle
+        if i + 2 < len(edges):
+            nextStart, nextEnd = edges[i + 1], edges[i + 2]
+        else:
+            nextStart, nextEnd = n - 1, n
+        avgX = x[nextStart:nextEnd].mean()
+        avgY = y[nextStart:nextEnd].mean()
+
+        areas = np.abs(
+            (x[previous] - avgX) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avgY - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return selected
+
+
+def collinearMask(vertices, tol=1e-12):
+    """Returns a boolean mask of the vertices of a path which are not
+    collinear with their neighbours, the end points are always kept.
+
+    Arguments:
+        vertices {array} -- (n, 2) array of the vertices of the path
+
+    Keyword Arguments:
+        tol {float} -- Largest cross product which is considered collinear
+            (default: {1e-12})
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    keep = np.ones(len(vertices), dtype=bool)
+
+    if len(vertices) < 3:
+        return keep
+
+    before = vertices[1:-1] - vertices[:-2]
+    after = vertices[2:] - vertices[1:-1]
+    cross = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0]
+
+    # A vertex is removed only if its neighbours lie on either side of it,
+    # otherwise turning points of the path would also be lost
+    forward = (before * after).sum(axis=1) > 0
+    keep[1:-1] = ~((np.abs(cross) <= tol) & forward)
+
+    return keep
+
+
+def decimateLine(x, y, budget=None):
+    """Decimates a line to at most `budget` points, returns the x and y
+    values of the selected points
+
+    Arguments:
+        x {array} -- X values of the line
+        y {array} -- Y values of the line
+
+    Keyword Arguments:
+        budget {int} -- Maximum number of points, None keeps all the points
+            (default: {None})
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+
+    if budget is None:
+        return x, y
+
+    indices = lttb(x, y, budget)
+    return x[indices], y[indices]
+
+
+def decimatePolygon(polygon, budget=None):
+    """Decimates a polygon of the phase plot. The polygon is made of the
+    vertices on the Temperature axis, and the melt fraction path between
+    them. Only the interior of the path is decimated, hence the vertices at
+    the assemblage boundaries are kept exactly.
+
+    Arguments:
+        polygon {list} -- List of (F, Temperature) vertices
+
+    Keyword Arguments:
+        budget {int} -- Maximum number of vertices of the polygon, None only
+            removes the collinear vertices (default: {None})
+    """
+    if len(polygon) < 5:
+        return polygon
+
+    path = np.asarray(polygon[1:-1], dtype=float)
+    path = path[collinearMask(path)]
+
+    if budget is not None and len(path) > budget - 2:
+        path = path[lttb(path[:, 0], path[:, 1], max(budget - 2, 3))]
+
+    return [polygon[0], *map(tuple, path), polygon[-1]]
@@ -0,0 +1,137 @@
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+
+# Columns of phase_main holding the formula of the solids
+FORMULACOLUMNS = ('Formula', 'formula')
+
+# alphaMELTS marks the oxidation state of Fe with primes, Fe'' and Fe'''
+OXIDATION = {
+    '': '',
+    "''": '2+',
+    "'''": '3+'
+}
+
+# MELTS can print small negative site amounts, such as Fe'''-0.01
+_TOKEN = re.compile(
+    r"\("
+    r"|\)(-?(?:[0-9]+\.?[0-9]*|\.[0-9]+))?"
+    r"|([A-Z][a-z]?)('*)(-?(?:[0-9]+\.?[0-9]*|\.[0-9]+))?"
+)
+
+# Distinct formulas kept parsed across calls, as the same formulas repeat
+# across steps and runs (least recently used are dropped past this)
+MEMOSIZE = 4096
+
+
+def _amount(text):
+    """Number of atoms (or multiplier of a group), 1 if not written"""
+    return float(text) if text else 1.0
+
+
+def parseFormula(formula):
+    """Parses a mineral formula, such as "(Mg0.90Fe''0.10)2SiO4", into the
+    number of atoms of every element (Fe2+ and Fe3+ are kept separate)
+
+    Arguments:
+        formula {str} -- formula of the phase
+    """
+    stack = [dict()]
+    pos = 0
+
+    for match in _TOKEN.finditer(formula):
+        if match.start() != pos:
+            break
+        pos = match.end()
+
+        token = match.group(0)
+        if token == '(':
+            stack.append(dict())
+        elif token.startswith(')'):
+            if len(stack) == 1:
+                break
+            group = stack.pop()
+            multiplier = _amount(match.group(1))
+            for element, n in group.items():
+                stack[-1][element] = stack[-1].get(element, 0.0) + n * multiplier
+        else:
+            element = match.group(2) + OXIDATION.get(match.group(3), match.group(3))
+            stack[-1][element] = stack[-1].get(element, 0.0) + _amount(match.group(4))
+
+    if pos != len(formula) or len(stack) != 1:
+        raise ValueError("Can not parse formula: {}".format(formula))
+
+    return stack[0]
+
+
+@lru_cache(maxsize=MEMOSIZE)
+def _parseMemo(formula):
+    """Cached parseFormula, None if the formula can not be parsed. The
+    returned dict is shared between calls and must not be modified"""
+    try:
+        return parseFormula(formula)
+    except ValueError as e:
+        print("[-] {}".format(e))
+        return None
+
+
+def parseFormulas(formulas):
+    """Parses a column of formulas into one numeric column per element. Every
+    distinct formula is parsed only once.
+
+    Arguments:
+        formulas {Series} -- formula of every row
+
+    Returns:
+        DataFrame -- atoms of every element (float32), NaN for rows without a
+            formula (or with a formula which could not be parsed), with the
+            index of formulas
+    """
+    codes, uniques = pd.factorize(formulas)
+    parsed = [_parseMemo(formula) for formula in uniques]
+
+    elements = list(dict.fromkeys(el for atoms in parsed if atoms for el in atoms))
+    elementIndex = {el: i for i, el in enumerate(elements)}
+
+    # One row per distinct formula, and a last row of NaN for the rows
+    # without formula (code -1)
+    table = np.zeros((len(uniques) + 1, len(elements)), dtype=np.float32)
+    table[-1] = np.nan
+    for row, atoms in enumerate(parsed):
+        if atoms is None:
+            table[row] = np.nan
+            continue
+        for element, n in atoms.items():
+            table[row, elementIndex[element]] = n
+
+    return pd.DataFrame(table[codes], columns=elements, index=formulas.index)
+
+
+def formulaTable(phaseMain):
+    """Returns the stoichiometry of the solids of phase_main, one row per row
+    of phase_main with a formula. Phase and Structure are stored as
+    categories, and the index is the index of the row in phase_main.
+
+    Arguments:
+        phaseMain {DataFrame} -- phase_main table
+
+    Returns:
+        DataFrame -- None if phase_main has no formulas
+    """
+    column = next((col for col in FORMULACOLUMNS if col in phaseMain.columns), None)
+    if column is None:
+        return None
+
+    rows = phaseMain[phaseMain[column].notna()]
+
+    DF = pd.DataFrame(index=rows.index)
+    for col in ('Pressure', 'Temperature'):
+        if col in rows.columns:
+            DF[col] = pd.to_numeric(rows[col])
+    DF['Phase'] = rows['Phase'].astype('category')
+    if 'Structure' in rows.columns:
+        DF['Structure'] = rows['Structure'].astype('category')
+
+    return pd.concat([DF, parseFormulas(rows[column])], axis=1)
@@ -0,0 +1,276 @@
+import matplotlib
+# The server never opens windows, figures are only rendered to images
+matplotlib.use('Agg')
+
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from matplotlib import pyplot as plt
+import threading
+import getopt
+import json
+import sys
+import io
+import os
+
+# From local file
+from Plot import makePhasePlot, \
+                 _plotfractionationScheme
+from tidyTables import tablePath, \
+                       readCSV
+
+
+CONTENTTYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml'
+}
+
+PLOTS = ('phase', 'fractionation')
+
+
+class LRUCache:
+    """Least recently used cache, which is bounded by the total size of the
+    cached values rather than their number
+
+    Arguments:
+        maxBytes {int} -- Maximum total size of the cached values
+        sizeof {function} -- Returns the size of a value in bytes
+    """
+
+    def __init__(self, maxBytes, sizeof):
+        self.maxBytes = maxBytes
+        self.sizeof = sizeof
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.size -= self._items.pop(key)[1]
+
+            # Values larger than the whole cache are not cached at all
+            if size > self.maxBytes:
+                return
+
+            self._items[key] = (value, size)
+            self.size += size
+
+            while self.size > self.maxBytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.size -= evicted
+
+    def keys(self):
+        with self._lock:
+            return list(self._items.keys())
+
+
+def _sizeofDF(DF):
+    return int(DF.memory_usage(index=True, deep=True).sum())
+
+
+class PlotServer:
+    """Holds the parsed tables of the runs, and the rendered images in memory,
+    so that plotting the same run again does not have to read the CSV files
+
+    Keyword Arguments:
+        runBudget {int} -- Memory (bytes) for the parsed tables
+            (default: {512 MB})
+        imageBudget {int} -- Memory (bytes) for the rendered images
+            (default: {64 MB})
+    """
+
+    def __init__(self, runBudget=512 * 2**20, imageBudget=64 * 2**20):
+        self.tables = LRUCache(runBudget, _sizeofDF)
+        self.images = LRUCache(imageBudget, len)
+
+        # pyplot keeps global state, hence only one figure is rendered at a
+        # time
+        self._renderLock = threading.Lock()
+
+    def readTable(self, run, table):
+        """Returns the table of a run, reading the CSV file only if it is not
+        already in memory, or if it has changed since it was read
+
+        Arguments:
+            run {str} -- Directory containing the CSV files of the run
+            table {str} -- Name of the table (phase_main, system_main, ...)
+        """
+        path = tablePath(run, table)
+        if not path:
+            raise FileNotFoundError("No table {} in {}".format(table, run))
+
+        key = (os.path.abspath(path), os.path.getmtime(path))
+
+        DF = self.tables.get(key)
+        if DF is None:
+            print("[+] Reading {}".format(path))
+            DF = readCSV(path)
+            self.tables.put(key, DF)
+
+        return DF, key
+
+    def render(self, kind, params):
+        """Returns the image of a plot, and its content type
+
+        Arguments:
+            kind {str} -- 'phase' or 'fractionation'
+            params {dict} -- Parameters of the plot, from the query string
+        """
+        fmt = params.get('fmt', 'png')
+        if fmt not in CONTENTTYPES:
+            raise ValueError("Unknown format: {}".format(fmt))
+
+        if 'run' not in params:
+            raise ValueError("Missing parameter: run")
+
+        budget = int(params['budget']) if 'budget' in params else None
+
+        if kind == 'phase':
+            # The assemblages and the path of the run are much smaller than
+            # phase_main, which is read only for runs written without them
+            try:
+                DF, segmentsKey = self.readTable(params['run'], 'assemblages')
+                path, pathKey = self.readTable(params['run'], 'system_main')
+                tableKey = (segmentsKey, pathKey)
+            except FileNotFoundError:
+                DF, tableKey = self.readTable(params['run'], 'phase_main')
+                path = None
+        elif kind == 'fractionation':
+            for param in ('x', 'y'):
+                if param not in params:
+                    raise ValueError("Missing parameter: {}".format(param))
+
+            DF, tableKey = self.readTable(
+                params['run'],
+                params.get('table', 'phase_main')
+            )
+            for col in (params['x'], params['y']):
+                if col not in DF.columns:
+                    raise ValueError("Unknown column: {}".format(col))
+        else:
+            raise KeyError(kind)
+
+        key = (kind, tableKey, tuple(sorted(params.items())))
+        image = self.images.get(key)
+        if image is not None:
+            return image, CONTENTTYPES[fmt]
+
+        with self._renderLock:
+            # Figures of a failed render are closed as well, as they would
+            # otherwise be kept by pyplot for as long as the server runs
+            figures = set(plt.get_fignums())
+            try:
+                if kind == 'phase':
+                    fig, ax = makePhasePlot(DF, params.get('title', ''), budget, path)
+                else:
+                    fig, ax = _plotfractionationScheme(
+                        DF.copy(),
+                        params['x'],
+                        params['y'],
+                        budget=budget
+                    )
+
+                buffer = io.BytesIO()
+                fig.savefig(buffer, format=fmt, bbox_inches='tight')
+            finally:
+                for num in set(plt.get_fignums()) - figures:
+                    plt.close(num)
+
+        image = buffer.getvalue()
+        self.images.put(key, image)
+
+        return image, CONTENTTYPES[fmt]
+
+
+def makeHandler(server):
+    """Returns the request handler class serving the plots of the server"""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, status, body, contentType='text/plain'):
+            if isinstance(body, str):
+                body = body.encode()
+
+            self.send_response(status)
+            self.send_header('Content-Type', contentType)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            kind = url.path.strip('/')
+
+            if kind == 'runs':
+                runs = sorted(set(
+                    os.path.dirname(path) for (path, _) in server.tables.keys()
+                ))
+                return self._send(200, json.dumps(runs), 'application/json')
+
+            if kind not in PLOTS:
+                return self._send(404, "Unknown plot: {}".format(kind))
+
+            try:
+                image, contentType = server.render(kind, params)
+            except FileNotFoundError as e:
+                return self._send(404, str(e))
+            except KeyError as e:
+                # A column missing from the table of the run
+                return self._send(400, "Missing column: {}".format(e))
+            except ValueError as e:
+                return self._send(400, str(e))
+            except Exception as e:
+                print("[-] Failed to render {}: {!r}".format(self.path, e))
+                return self._send(500, "Failed to render the plot: {}".format(e))
+
+            self._send(200, image, contentType)
+
+    return Handler
+
+
+def getArgs():
+    """Reads the port and the memory budget (in MB) of the server from the
+    arguments
+    """
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "p:m:", ["port=", "memory="])
+    except getopt.GetoptError:
+        print('{} -p <port> -m <memory in MB>'.format(sys.argv[0]))
+        sys.exit(2)
+
+    port = 8050
+    memory = 512
+    for opt, arg in opts:
+        if opt in ("-p", "--port"):
+            port = int(arg)
+        elif opt in ("-m", "--memory"):
+            memory = int(arg)
+
+    return port, memory
+
+
+if __name__ == '__main__':
+    port, memory = getArgs()
+
+    plotServer = PlotServer(runBudget=memory * 2**20)
+    httpd = ThreadingHTTPServer(('127.0.0.1', port), makeHandler(plotServer))
+
+    print("[+] Serving plots at http://127.0.0.1:{}/".format(port))
+    print("[+] /phase?run=<output dir>&fmt=png|svg&title=<title>")
+    print("[+] /fractionation?run=<output dir>&table=<table>&x=<col>&y=<col>")
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[+] Shutting down")
+        httpd.server_close()
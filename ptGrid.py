@@ -0,0 +1,351 @@
+import numpy as np
+import pandas as pd
+import getopt
+import sys
+import os
+
+# From local file
+from Plot import mapPhases
+
+
+def gridEdges(minimum, maximum, step):
+    """Returns the edges of the cells along one axis of the grid. The step
+    has to divide the range, the edges are computed from the number of cells
+    so that floating point steps do not add or shift an edge.
+
+    Arguments:
+        minimum {float} -- first edge
+        maximum {float} -- last edge
+        step {float} -- width of the cells
+    """
+    if step <= 0 or maximum <= minimum:
+        raise ValueError("Invalid range {}:{}:{}".format(minimum, maximum, step))
+
+    ncells = (maximum - minimum) / step
+    if abs(ncells - round(ncells)) > 1e-6:
+        raise ValueError("Step {} does not divide the range {}:{}".format(
+            step, minimum, maximum
+        ))
+
+    return np.linspace(minimum, maximum, int(round(ncells)) + 1)
+
+
+class PTGrid:
+    """Regular Pressure-Temperature grid, onto which the phase data of many
+    runs is binned. Every cell holds the stable assemblage (as a code into
+    `assemblages`) and the mean melt fraction of the steps which fell in it.
+
+    Runs are added one at a time, hence a sweep never has to be held in
+    memory at once.
+
+    Arguments:
+        pRange {tuple} -- (minimum, maximum, step) of Pressure
+        tRange {tuple} -- (minimum, maximum, step) of Temperature
+    """
+
+    # Assemblage codes are stored as int16
+    MAXCODES = 2**15
+
+    def __init__(self, pRange, tRange):
+        self.pEdges = gridEdges(*pRange)
+        self.tEdges = gridEdges(*tRange)
+        self.shape = (len(self.tEdges) - 1, len(self.pEdges) - 1)
+
+        ncells = self.shape[0] * self.shape[1]
+        self._count = np.zeros(ncells, dtype=np.int64)
+        self._fSum = np.zeros(ncells, dtype=np.float64)
+
+        # Number of steps of every assemblage in every cell, indexed by
+        # cell * MAXCODES + code
+        self._votes = pd.Series(dtype=np.int64)
+
+        self.phases = []
+        self._phaseIndex = dict()
+        self.assemblages = []
+        self._assemblageIndex = dict()
+
+    def _cells(self, P, T):
+        """Returns the flat index of the cell of every (P, T), and a mask of
+        the points inside the grid
+        """
+        i = np.searchsorted(self.tEdges, T, side='right') - 1
+        j = np.searchsorted(self.pEdges, P, side='right') - 1
+
+        # The last edge belongs to the last cell
+        i[T == self.tEdges[-1]] = self.shape[0] - 1
+        j[P == self.pEdges[-1]] = self.shape[1] - 1
+
+        inside = (i >= 0) & (i < self.shape[0]) & (j >= 0) & (j < self.shape[1])
+        return i * self.shape[1] + j, inside
+
+    def _assemblageCodes(self, stepIds, phaseNames):
+        """Returns the code of the assemblage of every step
+
+        Arguments:
+            stepIds {array} -- Step of every phase row (0 to nsteps-1)
+            phaseNames {array} -- Name of the phase of every row
+        """
+        for phase in pd.unique(phaseNames):
+            if phase not in self._phaseIndex:
+                self._phaseIndex[phase] = len(self.phases)
+                self.phases.append(phase)
+
+        phaseIds = np.array([self._phaseIndex[p] for p in phaseNames], dtype=int)
+
+        # Presence matrix of steps x phases, steps with the same row have the
+        # same assemblage
+        presence = np.zeros((stepIds.max() + 1, len(self.phases)), dtype=bool)
+        presence[stepIds, phaseIds] = True
+
+        unique, inverse = np.unique(presence, axis=0, return_inverse=True)
+
+        codes = np.empty(len(unique), dtype=np.int64)
+        for n, row in enumerate(unique):
+            assemblage = tuple(str(p) for p in np.array(self.phases)[row])
+            if assemblage not in self._assemblageIndex:
+                if len(self.assemblages) >= self.MAXCODES:
+                    raise ValueError("Too many assemblages for the grid")
+                self._assemblageIndex[assemblage] = len(self.assemblages)
+                self.assemblages.append(assemblage)
+            codes[n] = self._assemblageIndex[assemblage]
+
+        return codes[inverse.ravel()]
+
+    def add(self, phaseMain):
+        """Bins the steps of a run onto the grid
+
+        Arguments:
+            phaseMain {DataFrame} -- phase_main table of the run
+        """
+        if len(phaseMain) == 0:
+            return
+
+        P = pd.to_numeric(phaseMain['Pressure']).to_numpy()
+        T = pd.to_numeric(phaseMain['Temperature']).to_numpy()
+        F = pd.to_numeric(phaseMain['F']).to_numpy()
+
+        # Every distinct (P, T) of the run is one step
+        steps = pd.MultiIndex.from_arrays([P, T])
+        stepIds, stepIndex = pd.factorize(steps)
+        first = np.unique(stepIds, return_index=True)[1]
+
+        codes = self._assemblageCodes(stepIds, phaseMain['Phase'].to_numpy())
+        cells, inside = self._cells(P[first], T[first])
+
+        cells = cells[inside]
+        codes = codes[inside]
+        F = F[first][inside]
+
+        ncells = len(self._count)
+        self._count += np.bincount(cells, minlength=ncells)
+        self._fSum += np.bincount(cells, weights=np.nan_to_num(F), minlength=ncells)
+
+        votes = pd.Series(cells * self.MAXCODES + codes).value_counts()
+        self._votes = self._votes.add(votes, fill_value=0).astype(np.int64)
+
+    @property
+    def codes(self):
+        """Assemblage code of every cell, -1 for cells without any data"""
+        codes = np.full(len(self._count), -1, dtype=np.int16)
+
+        if len(self._votes):
+            keys = self._votes.index.to_numpy()
+            cells = keys // self.MAXCODES
+
+            # Most frequent assemblage of the cell wins
+            order = np.lexsort((self._votes.to_numpy(), cells))
+            last = np.flatnonzero(np.append(cells[order][1:] != cells[order][:-1], True))
+            winners = keys[order][last]
+            codes[winners // self.MAXCODES] = winners % self.MAXCODES
+
+        return codes.reshape(self.shape)
+
+    @property
+    def F(self):
+        """Mean melt fraction of every cell, NaN for cells without any data"""
+        F = np.full(len(self._count), np.nan, dtype=np.float32)
+        filled = self._count > 0
+        F[filled] = self._fSum[filled] / self._count[filled]
+        return F.reshape(self.shape)
+
+    def save(self, path):
+        """Saves the grid as assemblage codes and melt fraction arrays"""
+        np.savez_compressed(
+            path,
+            codes=self.codes,
+            F=self.F,
+            pEdges=self.pEdges,
+            tEdges=self.tEdges,
+            assemblages=np.array([' + '.join(a) for a in self.assemblages])
+        )
+
+    def render(self, what='assemblage', ax=None):
+        """Draws the grid as an image
+
+        Keyword Arguments:
+            what {str} -- 'assemblage' or 'F' (default: {'assemblage'})
+            ax {Axes} -- Axes to draw on, a new figure is created if None
+                (default: {None})
+        """
+        from matplotlib import pyplot as plt
+        from matplotlib.colors import ListedColormap
+        from matplotlib.patches import Patch
+
+        if ax is None:
+            fig, ax = plt.subplots(figsize=(8, 6))
+        else:
+            fig = ax.figure
+
+        extent = [self.pEdges[0], self.pEdges[-1], self.tEdges[0], self.tEdges[-1]]
+
+        if what == 'F':
+            image = ax.imshow(
+                self.F, origin='lower', extent=extent, aspect='auto',
+                cmap='viridis', vmin=0, vmax=1, interpolation='nearest'
+            )
+            fig.colorbar(image, ax=ax, label='Melt fraction (F)')
+        else:
+            codes = np.ma.masked_less(self.codes, 0)
+            cmap = plt.get_cmap('tab20')
+            colors = [cmap(i % cmap.N) for i in range(max(len(self.assemblages), 1))]
+
+            ax.imshow(
+                codes, origin='lower', extent=extent, aspect='auto',
+                cmap=ListedColormap(colors), vmin=-0.5,
+                vmax=len(colors) - 0.5, interpolation='nearest'
+            )
+
+            present = np.unique(codes.compressed())
+            labels = mapPhases([self.assemblages[c] for c in present])
+            handles = [
+                Patch(facecolor=colors[c], label=" + ".join(label))
+                for c, label in zip(present, labels)
+            ]
+            ax.legend(handles=handles, loc="upper left", bbox_to_anchor=(1, 1))
+
+        ax.set_xlabel('Pressure')
+        ax.set_ylabel('Temperature')
+
+        return fig, ax
+
+
+# Columns of phase_main which are required for the grid
+COLUMNS = ['Pressure', 'Temperature', 'Phase', 'F']
+
+
+def readPhaseMain(path):
+    """Reads only the columns of phase_main.csv which are required for the
+    grid
+
+    Arguments:
+        path {str} -- Output directory of the run, or path of phase_main.csv
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, 'phase_main.csv')
+
+    return pd.read_csv(path, usecols=COLUMNS)
+
+
+def aggregateRuns(runs, pRange, tRange):
+    """Bins the phase data of many runs onto a Pressure-Temperature grid
+
+    Arguments:
+        runs {iterable} -- phase_main DataFrames, or the paths of the runs
+        pRange {tuple} -- (minimum, maximum, step) of Pressure
+        tRange {tuple} -- (minimum, maximum, step) of Temperature
+    """
+    grid = PTGrid(pRange, tRange)
+
+    for run in runs:
+        if isinstance(run, str):
+            print("[+] Adding {}".format(run))
+            run = readPhaseMain(run)
+        grid.add(run)
+
+    return grid
+
+
+def iterSources(sources, budget):
+    """Yields the runs of the sources for aggregateRuns. A source is either
+    the output directory of a run (containing phase_main.csv), or a batch of
+    alphaMELTS runs (see iterRuns) which is extracted first. Extracted tables
+    are kept within the memory budget, and spilled to disk beyond it.
+
+    Arguments:
+        sources {list} -- paths of the sources
+        budget {int} -- Memory (bytes) for the extracted tables
+    """
+    # Imported here, as it is required only for extracting the runs
+    from batchRuns import collectBatch
+    from tableStore import TableStore
+
+    for source in sources:
+        if os.path.isfile(os.path.join(source, 'phase_main.csv')):
+            yield source
+            continue
+
+        store = collectBatch(source, TableStore(budget), tables=('phase_main',))
+        for run, DF in store.iterTable('phase_main', COLUMNS):
+            print("[+] Adding {}".format(run))
+            yield DF
+
+
+def _range(arg):
+    return tuple(float(x) for x in arg.split(':'))
+
+
+def getArgs():
+    """Reads the grid ranges, output path and the runs from the arguments"""
+    usage = '{} -p <min:max:step> -t <min:max:step> -o <output> [-m <memory in MB>] <run> ...'.format(sys.argv[0])
+    try:
+        opts, args = getopt.getopt(
+            sys.argv[1:],
+            "p:t:o:m:",
+            ["pressure=", "temperature=", "output=", "memory="]
+        )
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+
+    pRange, tRange, output, memory = None, None, 'ptGrid', 1024
+    for opt, arg in opts:
+        if opt in ("-p", "--pressure"):
+            pRange = _range(arg)
+        elif opt in ("-t", "--temperature"):
+            tRange = _range(arg)
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt in ("-m", "--memory"):
+            memory = int(arg)
+
+    if not pRange or not tRange or not args:
+        print(usage)
+        sys.exit(2)
+
+    for name, axisRange in (('Pressure', pRange), ('Temperature', tRange)):
+        try:
+            gridEdges(*axisRange)
+        except (ValueError, TypeError):
+            print("[-] Invalid {} range: {}".format(name, ':'.join(str(x) for x in axisRange)))
+            print(usage)
+            sys.exit(2)
+
+    return pRange, tRange, output, memory, args
+
+
+if __name__ == '__main__':
+    import matplotlib
+    matplotlib.use('Agg')
+
+    pRange, tRange, output, memory, sources = getArgs()
+
+    grid = aggregateRuns(iterSources(sources, memory * 2**20), pRange, tRange)
+
+    print("[+] Saving grid at: {}.npz".format(output))
+    grid.save(output + '.npz')
+
+    for what in ('assemblage', 'F'):
+        fig, ax = grid.render(what)
+        fpath = '{}_{}.png'.format(output, what)
+        print("[+] Saving Plot at: {}".format(fpath))
+        fig.savefig(fpath, bbox_inches='tight')
@@ -0,0 +1,164 @@
+import tarfile
+import zipfile
+import os
+
+# From local file
+from utils import readTable
+
+
+# Tables which are read by extractData
+TABLES = (
+    'phase_main',
+    'phase_mass',
+    'phase_vol',
+    'solid_comp',
+    'system_main',
+    'trace_main',
+    'bulk_comp'
+)
+
+
+def tableKey(filename):
+    """Returns the name of the table (phase_main, system_main, ...) of a table
+    file, None if the file is not an alphaMELTS table
+
+    Arguments:
+        filename {str} -- name or path of the file, can be gzip compressed
+    """
+    name = os.path.basename(filename)
+    if name.endswith('.gz'):
+        name = name[:-3]
+
+    if not name.endswith('_tbl.txt'):
+        return None
+
+    return name[:-len('_tbl.txt')].lower()
+
+
+def _decode(fileobj, name):
+    """Reads the lines of a (possibly gzip compressed) archive member"""
+    return readTable(fileobj, compressed=name.endswith('.gz'))
+
+
+def isArchive(path):
+    return os.path.isfile(path) and (
+        tarfile.is_tarfile(path) or zipfile.is_zipfile(path)
+    )
+
+
+def _runName(member):
+    return os.path.dirname(member.rstrip('/')) or '.'
+
+
+def iterRuns(path, tables=TABLES):
+    """Yields (name of the run, input files of the run) for every run in a
+    directory or an archive, the input files can be passed to extractData.
+
+    A directory either contains the tables of one run, or one subdirectory
+    per run. Archives are read sequentially member by member, without being
+    extracted, hence the tables of a run have to be stored together in the
+    archive (which is the case for any archive created with tar or zip).
+
+    Arguments:
+        path {str} -- Directory, tar (.tar, .tar.gz, ...) or zip archive
+
+    Keyword Arguments:
+        tables {tuple} -- Names of the tables to read (default: {TABLES})
+    """
+    if os.path.isdir(path):
+        yield from _iterDirectory(path, tables)
+    elif tarfile.is_tarfile(path):
+        yield from _iterTar(path, tables)
+    elif zipfile.is_zipfile(path):
+        yield from _iterZip(path, tables)
+    else:
+        raise ValueError("{} is neither a directory nor an archive".format(path))
+
+
+def _iterDirectory(path, tables):
+    def inputfiles(directory):
+        return {
+            tableKey(f): os.path.join(directory, f)
+            for f in sorted(os.listdir(directory))
+            if tableKey(f) in tables
+        }
+
+    files = inputfiles(path)
+    if files:
+        yield '.', files
+        return
+
+    for name in sorted(os.listdir(path)):
+        directory = os.path.join(path, name)
+        if os.path.isdir(directory):
+            files = inputfiles(directory)
+            if files:
+                yield name, files
+
+
+def _iterMembers(members, tables):
+    """Groups a sequence of (member name, function reading the member) into
+    runs, a run ends when a member of another directory is found
+    """
+    current, files = None, dict()
+    finished = set()
+
+    for name, read in members:
+        key = tableKey(name)
+        if key not in tables:
+            continue
+
+        run = _runName(name)
+        if run != current:
+            if files:
+                yield current, files
+                finished.add(current)
+            if run in finished:
+                raise ValueError(
+                    "Tables of run {} are not stored together".format(run)
+                )
+            current, files = run, dict()
+
+        files[key] = read()
+
+    if files:
+        yield current, files
+
+
+def _iterTar(path, tables):
+    # Streaming mode, the archive is never seeked back
+    with tarfile.open(path, mode='r|*') as tar:
+        members = (
+            (member.name, lambda member=member: _decode(tar.extractfile(member), member.name))
+            for member in tar
+            if member.isfile()
+        )
+        yield from _iterMembers(members, tables)
+
+
+def _iterZip(path, tables):
+    with zipfile.ZipFile(path) as archive:
+        members = (
+            (info.filename, lambda info=info: _decode(archive.open(info), info.filename))
+            for info in archive.infolist()
+            if not info.is_dir()
+        )
+        yield from _iterMembers(members, tables)
+
+
+def readRun(path, tables=TABLES):
+    """Returns the input files of a single run, from a directory or an
+    archive containing one run
+
+    Arguments:
+        path {str} -- Directory or archive of the run
+    """
+    runs = iterRuns(path, tables)
+    name, files = next(runs, (None, None))
+
+    if files is None:
+        raise ValueError("No tables found in {}".format(path))
+    if next(runs, None) is not None:
+        raise ValueError("{} contains more than one run".format(path))
+
+    return files
@@ -0,0 +1,201 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import tempfile
+import os
+
+
+def sizeof(DF):
+    """Memory used by a DataFrame, in bytes"""
+    return int(DF.memory_usage(index=True, deep=True).sum())
+
+
+def writeColumns(DF, path):
+    """Writes a DataFrame to a columnar file (an uncompressed .npz, with one
+    array per column), so that single columns can be read back without
+    reading the whole table
+
+    Arguments:
+        DF {DataFrame} -- the table to be written
+        path {str} -- path of the file
+    """
+    arrays = {'columns': np.array([str(col) for col in DF.columns])}
+
+    for i, col in enumerate(DF.columns):
+        values = DF[col]
+        if values.dtype == object or isinstance(values.dtype, pd.StringDtype):
+            # Stored as floats or fixed width unicode, with the missing values
+            # stored separately, as they can not be represented in the array
+            missing = values.isna().to_numpy()
+            kind = pd.api.types.infer_dtype(values, skipna=True)
+            if kind in ('floating', 'integer', 'mixed-integer-float'):
+                arrays['c{}'.format(i)] = values.to_numpy(dtype=float, na_value=np.nan)
+            else:
+                arrays['c{}'.format(i)] = values.fillna('').astype(str).to_numpy(dtype=str)
+                if kind == 'mixed':
+                    # Numbers among the strings (such as the padding of
+                    # solid_comp), which are restored as numbers
+                    arrays['n{}'.format(i)] = np.array(
+                        [isinstance(v, (int, float)) for v in values],
+                        dtype=bool
+                    ) & ~missing
+            arrays['m{}'.format(i)] = missing
+        else:
+            arrays['c{}'.format(i)] = values.to_numpy()
+
+    np.savez(path, **arrays)
+
+
+def readColumns(path, columns=None):
+    """Reads a table written by writeColumns
+
+    Arguments:
+        path {str} -- path of the file
+
+    Keyword Arguments:
+        columns {list} -- columns to be read, all if None (default: {None})
+    """
+    with np.load(path, allow_pickle=False) as f:
+        allColumns = list(f['columns'])
+        if columns is None:
+            columns = allColumns
+
+        data = dict()
+        for col in columns:
+            i = allColumns.index(col)
+            values = f['c{}'.format(i)]
+            if 'm{}'.format(i) in f.files:
+                values = values.astype(object)
+                if 'n{}'.format(i) in f.files:
+                    numbers = f['n{}'.format(i)]
+                    values[numbers] = values[numbers].astype(float)
+                values[f['m{}'.format(i)]] = None
+            data[col] = values
+
+    return pd.DataFrame(data, columns=columns)
+
+
+class SpilledTable:
+    """Handle to a table which has been written to disk
+
+    Arguments:
+        path {str} -- path of the columnar file
+        columns {list} -- columns of the table
+        nrows {int} -- number of rows of the table
+    """
+
+    def __init__(self, path, columns, nrows):
+        self.path = path
+        self.columns = columns
+        self.nrows = nrows
+
+    def load(self, columns=None):
+        return readColumns(self.path, columns)
+
+
+class TableStore:
+    """Holds the tables of many runs within a memory budget. Once the tables
+    in memory exceed the budget, the least recently added tables are written
+    to columnar files in the spill directory and only their handles are kept.
+
+    Keyword Arguments:
+        budget {int} -- Memory (bytes) for the tables in memory
+            (default: {1 GB})
+        spillDir {str} -- Directory for the spilled tables, a temporary
+            directory if None (default: {None})
+    """
+
+    def __init__(self, budget=2**30, spillDir=None):
+        self.budget = budget
+
+        if spillDir is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix='alphameltsData_')
+            spillDir = self._tmp.name
+        elif not os.path.isdir(spillDir):
+            os.makedirs(spillDir)
+        self.spillDir = spillDir
+
+        # (run, table): DataFrame or SpilledTable, in the order of addition
+        self._tables = OrderedDict()
+        self._sizes = dict()
+        self.memory = 0
+        self.spilled = 0
+        self._files = 0
+
+    def put(self, run, table, DF):
+        key = (run, table)
+        self._drop(key)
+
+        self._tables[key] = DF
+        self._sizes[key] = sizeof(DF)
+        self.memory += self._sizes[key]
+
+        self._enforce()
+
+    def putRun(self, run, Data):
+        """Adds all the tables of a run (a Data dictionary of extractData)"""
+        for table, DF in Data.items():
+            self.put(run, table, DF)
+
+    def _drop(self, key):
+        value = self._tables.pop(key, None)
+        if isinstance(value, SpilledTable):
+            os.remove(value.path)
+        elif value is not None:
+            self.memory -= self._sizes.pop(key)
+
+    def _enforce(self):
+        """Spills the oldest tables in memory until they fit in the budget"""
+        if self.memory <= self.budget:
+            return
+
+        for key, value in list(self._tables.items()):
+            if self.memory <= self.budget:
+                break
+            if isinstance(value, SpilledTable):
+                continue
+            self._spill(key)
+
+    def _spill(self, key):
+        DF = self._tables[key]
+        path = os.path.join(self.spillDir, '{}.npz'.format(self._files))
+        self._files += 1
+
+        writeColumns(DF, path)
+
+        self._tables[key] = SpilledTable(path, list(DF.columns), len(DF))
+        self.memory -= self._sizes.pop(key)
+        self.spilled += 1
+
+    def get(self, run, table, columns=None):
+        """Returns a table, read from disk if it has been spilled. Tables read
+        from disk are not kept in memory.
+
+        Keyword Arguments:
+            columns {list} -- columns to be returned, all if None
+                (default: {None})
+        """
+        value = self._tables[(run, table)]
+        if isinstance(value, SpilledTable):
+            return value.load(columns)
+
+        if columns is None:
+            return value
+        return value[columns]
+
+    def runs(self):
+        return list(OrderedDict.fromkeys(run for (run, _) in self._tables))
+
+    def iterTable(self, table, columns=None):
+        """Yields the table of every run one at a time, so that aggregations
+        over all the runs only hold a single spilled table in memory at once
+
+        Arguments:
+            table {str} -- name of the table
+
+        Keyword Arguments:
+            columns {list} -- columns to be read, all if None (default: {None})
+        """
+        for (run, name) in list(self._tables.keys()):
+            if name == table:
+                yield run, self.get(run, name, columns)
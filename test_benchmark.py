@@ -0,0 +1,47 @@
+import unittest
+import os
+
+# From local file
+from benchmark import BASELINE, \
+                      GATED, \
+                      OPTOUT, \
+                      readBaseline, \
+                      baselineFor, \
+                      machineKey, \
+                      runCase, \
+                      checkRegressions, \
+                      checkPhaseMain
+
+
+class TestPhaseMain(unittest.TestCase):
+
+    def test_matches_generated_run(self):
+        self.assertEqual(checkPhaseMain(), [])
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_gated_case_has_no_regression(self):
+        if os.environ.get(OPTOUT) == '1':
+            self.skipTest("{}=1".format(OPTOUT))
+
+        baselines = readBaseline()
+        baseline = baselineFor(baselines)
+        if baseline is None or GATED not in baseline['cases']:
+            self.fail(
+                "no {} baseline of {} at {} (baselines of: {}), create it with: "
+                "python benchmark.py -u -c {}, or set {}=1 to skip the check".format(
+                    GATED, machineKey(), BASELINE, ", ".join(baselines or ()) or "none",
+                    GATED, OPTOUT
+                )
+            )
+
+        repeat = baseline['cases'][GATED]['repeat']
+        result = runCase(GATED, repeat)
+
+        regressions = checkRegressions({GATED: result}, baseline)
+        self.assertEqual(regressions, [], "\n".join(regressions))
+
+
+if __name__ == '__main__':
+    unittest.main()
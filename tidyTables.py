@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import os
+
+# From local file
+from derivedData import phaseColumns
+
+
+# Tables which are mostly zero, as every phase exists only over a part of the
+# path, and the quantity their phase columns hold
+SPARSETABLES = {
+    'phase_mass': 'mass',
+    'phase_vol': 'volume',
+    'solid_comp': None,
+}
+
+# Phase of the columns which do not belong to a single phase
+SYSTEM = {
+    'phase_mass': 'system',
+    'phase_vol': 'system',
+    'solid_comp': 'solid',
+}
+
+LONGCOLUMNS = ['step', 'phase', 'quantity', 'value']
+
+
+def toLong(DF, table):
+    """Converts a wide table into a long ("tidy") table of
+    (step, phase, quantity, value), where the cells which are zero or missing
+    are left out
+
+    Arguments:
+        DF {DataFrame} -- phase_mass, phase_vol or solid_comp table
+        table {str} -- name of the table
+    """
+    phases = set(phaseColumns(DF))
+
+    columnPhase = []
+    columnQuantity = []
+    for col in DF.columns:
+        if col in phases:
+            columnPhase.append(col)
+            columnQuantity.append(SPARSETABLES[table])
+        else:
+            columnPhase.append(SYSTEM[table])
+            columnQuantity.append(col)
+
+    values = DF.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    steps, cols = np.nonzero((values != 0) & ~np.isnan(values))
+
+    return pd.DataFrame({
+        'step': steps,
+        'phase': pd.Categorical(
+            np.asarray(columnPhase, dtype=object)[cols],
+            categories=pd.unique(np.asarray(columnPhase, dtype=object))
+        ),
+        'quantity': pd.Categorical(
+            np.asarray(columnQuantity, dtype=object)[cols],
+            categories=pd.unique(np.asarray(columnQuantity, dtype=object))
+        ),
+        'value': values[steps, cols],
+    })
+
+
+def toWide(long):
+    """Converts a long table back into the wide table. Cells which are not in
+    the long table are zero, and columns which were zero at every step are
+    not restored.
+
+    Arguments:
+        long {DataFrame} -- table of (step, phase, quantity, value)
+    """
+    phase = long['phase'].astype(str).to_numpy()
+    quantity = long['quantity'].astype(str).to_numpy()
+
+    # Columns of the system (or the whole solid) are named by the quantity,
+    # and the columns of the phases by the phase
+    isSystem = np.isin(phase, list(SYSTEM.values()))
+    column = np.where(isSystem, quantity, phase)
+
+    columns = list(pd.unique(column))
+    codes = pd.Index(columns).get_indexer(column)
+
+    steps = long['step'].to_numpy(dtype=int)
+    nsteps = steps.max() + 1 if len(steps) else 0
+
+    values = np.zeros((nsteps, len(columns)))
+    values[steps, codes] = long['value'].to_numpy(dtype=float)
+
+    DF = pd.DataFrame(values, columns=columns)
+
+    # Pressure and Temperature first, as in the tables of alphaMELTS
+    first = [col for col in ('Pressure', 'Temperature') if col in columns]
+    return DF[first + [col for col in columns if col not in first]]
+
+
+def isLong(DF):
+    return all(col in DF.columns for col in LONGCOLUMNS)
+
+
+def tablePath(directory, table):
+    """Returns the path of the CSV file of a table in an output directory,
+    either in wide (<table>.csv) or in long form (<table>_long.csv), None if
+    the table is not there
+    """
+    for filename in (table + '.csv', table + '_long.csv'):
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path):
+            return path
+
+    return None
+
+
+def readCSV(path, **kwargs):
+    """Reads a CSV file written by writeCSV, long tables are converted back
+    to the wide form
+
+    Arguments:
+        path {str} -- path of the CSV file
+        **kwargs -- passed on to read_csv for wide tables
+    """
+    if path.endswith('_long.csv'):
+        return toWide(pd.read_csv(path))
+
+    DF = pd.read_csv(path, **kwargs)
+    if isLong(DF):
+        return toWide(DF)
+
+    return DF
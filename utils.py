@@ -1,5 +1,6 @@
 from collections import deque
 import pandas as pd
+import gzip
 from datetime import datetime as dt
 import os
 import sys
@@ -8,25 +9,38 @@ import re
 from tkinter import filedialog
 from tkinter import *
 
+# From local file
+from tidyTables import SPARSETABLES, \
+                       toLong
+
 
 def getArgs():
     """Reads the arguments and returns the path of the directory where all the 
-    output files are present
+    output files are present, and the number of processes extracting the
+    tables (-w)
     """
+    usage = '{} -i <inputfile> [-w <workers>]'.format(sys.argv[0])
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "io", ["ifile=", "ofile="])
+        opts, args = getopt.gnu_getopt(
+            sys.argv[1:],
+            "iow:h",
+            ["ifile=", "ofile=", "workers="]
+        )
     except getopt.GetoptError:
-        print('{} -i <inputfile>'.format(sys.argv[0]))
+        print(usage)
         sys.exit(2)
 
+    inputfile, workers = None, 1
     for opt, arg in opts:
         if opt == '-h':
-            print('{} -i <inputfile>'.format(sys.argv[0]))
+            print(usage)
             sys.exit()
         elif opt in ("-i", "--ifile"):
-            inputfile = args[0]
+            inputfile = args[0] if args else None
+        elif opt in ("-w", "--workers"):
+            workers = int(arg)
 
-    return inputfile
+    return inputfile, workers
 
 
 def extractDirName(filepath):
@@ -64,7 +78,7 @@ def moveTables(mainpath, outputDir):
         os.rename(origin, destination)
 
 
-def writeCSV(data, outputDir):
+def writeCSV(data, outputDir, sparse=False):
     """
     Takes in a dictionary of DataFrames with the names of their proposed file
     nanmes as the keys to the DataFrame
@@ -73,18 +87,59 @@ def writeCSV(data, outputDir):
         data: dictionary of DataFrames with the names of their files as the
             keys
         outputDir: Path to the directory where the CSV files are to saved
+        sparse: Write the mostly zero tables (phase_mass, phase_vol and
+            solid_comp) in long form, as <table>_long.csv, leaving out the
+            zeros
     """
 
     if not os.path.isdir(outputDir):
         os.makedirs(outputDir)
 
     for key in data.keys():
-        filename = key + ".csv"
+        if sparse and key in SPARSETABLES:
+            filename = key + "_long.csv"
+            DF = toLong(data[key], key)
+            index = False
+        else:
+            filename = key + ".csv"
+            DF = data[key]
+            index = True
+
         outputPath = os.path.join(outputDir, filename)
     
         with open(outputPath, 'w') as out:
             print("[+] Writing CSV at: {}".format(outputPath))
-            data[key].to_csv(out)
+            DF.to_csv(out, index=index)
+
+
+def readTable(source, compressed=None):
+    """Returns the lines of a table file. The table can be a path to the file,
+    a (binary) file object, such as a member of an archive, or the lines of
+    the table which are returned as they are.
+
+    Arguments:
+        source {str, file object or list} -- the table to be read
+
+    Keyword Arguments:
+        compressed {bool} -- whether the table is gzip compressed, if None it
+            is figured out from the extension of the path (default: {None})
+    """
+    if isinstance(source, (list, tuple)):
+        return list(source)
+
+    if isinstance(source, str):
+        if compressed is None:
+            compressed = source.endswith('.gz')
+
+        opener = gzip.open if compressed else open
+        with opener(source, 'rt') as f:
+            return f.readlines()
+
+    content = source.read()
+    if compressed:
+        content = gzip.decompress(content)
+
+    return content.decode().splitlines(keepends=True)
 
 
 def figureoutTable(filepath):
@@ -92,49 +147,49 @@ def figureoutTable(filepath):
     returns the value corresponding to the type of table the file contains
     
     Arguments:
-        filepath {str} -- path of the file containing the table
+        filepath {str or list} -- path of the file containing the table, or
+            the lines of the table
     """
-    with open(filepath) as f:
-        output = deque(f.readlines())
-        Title = output.popleft()
-
-        _ = output.popleft()
-
-        # Guide:
-        # 1. phase_main_tbl.txt (type 1) -- Starts with liquid_0 thermodynamic..
-        # 2. phase_main_tbl.txt (type 2) -- Starts with P T ...
-        # 3. phase_mass_tbl.txt -- starts with Phase Masses
-        # 4. phase_vol_tbl.txt -- starts with Phase Volumes
-        # 5. solid_comp_tbl.txt -- starts with Solid Composition
-        # 6. system_mail_tbl.txt -- starts with System Thermodynamic data
-        # 7. trace_main_tbl.txt -- starts as P Pval T Tval
-        # 8. bulk_comp_tbl.txt -- starts with Bulk Composition
-
-        tbl = None
-        if bool(re.search(r'[a-z]+_[0-9] ([a-z]+[ |:])+', output[0])):
-            # phase_main_tbl (type 1)
-            tbl = 1
-        elif bool(re.search(r'^([A-Za-z]+ [0-9]+\.?[0-9]{2}? ){2}\b', output[0])):
-            # phase_main_tbl (type 2)
-            tbl = 2
-        elif bool(re.search(r'Phase Masses:',output[0])):
-            # phase_mass_tbl
-            tbl = 3
-        elif bool(re.search(r'Phase Volumes:', output[0])):
-            # phase_vol_tbl
-            tbl = 4
-        elif bool(re.search(r'Solid Composition:', output[0])):
-            # solid_comp_tbl
-            tbl = 5
-        elif bool(re.search(r'System Thermodynamic Data:', output[0])):
-            # system_main_tbl
-            tbl = 6
-        elif bool(re.search(r'^([A-Za-z]+ [0-9]+\.?[0-9]{2}? ?){2}$', output[0])):
-            tbl = 7
-        elif bool(re.search(r'Bulk Composition:', output[0])):
-            tbl = 8
-        else:
-            tbl = 0
+    output = deque(readTable(filepath))
+    Title = output.popleft()
+
+    _ = output.popleft()
+
+    # Guide:
+    # 1. phase_main_tbl.txt (type 1) -- Starts with liquid_0 thermodynamic..
+    # 2. phase_main_tbl.txt (type 2) -- Starts with P T ...
+    # 3. phase_mass_tbl.txt -- starts with Phase Masses
+    # 4. phase_vol_tbl.txt -- starts with Phase Volumes
+    # 5. solid_comp_tbl.txt -- starts with Solid Composition
+    # 6. system_mail_tbl.txt -- starts with System Thermodynamic data
+    # 7. trace_main_tbl.txt -- starts as P Pval T Tval
+    # 8. bulk_comp_tbl.txt -- starts with Bulk Composition
+
+    tbl = None
+    if bool(re.search(r'[a-z]+_[0-9] ([a-z]+[ |:])+', output[0])):
+        # phase_main_tbl (type 1)
+        tbl = 1
+    elif bool(re.search(r'^([A-Za-z]+ [0-9]+\.?[0-9]{2}? ){2}\b', output[0])):
+        # phase_main_tbl (type 2)
+        tbl = 2
+    elif bool(re.search(r'Phase Masses:',output[0])):
+        # phase_mass_tbl
+        tbl = 3
+    elif bool(re.search(r'Phase Volumes:', output[0])):
+        # phase_vol_tbl
+        tbl = 4
+    elif bool(re.search(r'Solid Composition:', output[0])):
+        # solid_comp_tbl
+        tbl = 5
+    elif bool(re.search(r'System Thermodynamic Data:', output[0])):
+        # system_main_tbl
+        tbl = 6
+    elif bool(re.search(r'^([A-Za-z]+ [0-9]+\.?[0-9]{2}? ?){2}$', output[0])):
+        tbl = 7
+    elif bool(re.search(r'Bulk Composition:', output[0])):
+        tbl = 8
+    else:
+        tbl = 0
 
     return tbl
 